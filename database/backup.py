@@ -0,0 +1,107 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from database.connection import DB_DIR, DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Backup settings
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", str(DB_DIR / "backups")))
+BACKUP_INTERVAL = int(os.getenv("BACKUP_INTERVAL", "21600"))  # seconds, 0 disables the job
+BACKUP_RETENTION = int(os.getenv("BACKUP_RETENTION", "7"))  # backups kept
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "1024"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.01"))  # seconds between steps
+BACKUP_GZIP = os.getenv("BACKUP_GZIP", "1") == "1"
+
+BACKUP_PREFIX = "trihand_backup_"
+
+def _online_backup(target, pages, sleep):
+    """Copy the live database with the SQLite backup API (runs in a worker thread).
+
+    Copies ``pages`` pages per step and sleeps ``sleep`` seconds after each
+    step. The source is not locked between steps, so handlers keep reading
+    and writing while the copy is in progress.
+    """
+    progress = {'pages': 0, 'steps': 0}
+
+    def on_progress(status, remaining, total):
+        progress['pages'] = total
+        progress['steps'] += 1
+        # backup() itself only sleeps when a step finds the source busy
+        if remaining and sleep > 0:
+            time.sleep(sleep)
+
+    source = sqlite3.connect(str(DB_PATH))
+    destination = sqlite3.connect(str(target))
+    try:
+        source.backup(destination, pages=pages, progress=on_progress, sleep=sleep)
+    finally:
+        destination.close()
+        source.close()
+    return progress
+
+def _gzip_file(path):
+    """Compress a finished backup and remove the uncompressed copy."""
+    gz_path = path.with_name(path.name + ".gz")
+    with open(path, 'rb') as src, gzip.open(gz_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    path.unlink()
+    return gz_path
+
+def _rotate(directory, keep):
+    """Delete the oldest backups beyond the retention count."""
+    backups = sorted(directory.glob(f"{BACKUP_PREFIX}*.db*"))
+    backups = [path for path in backups if not path.name.endswith(".partial")]
+    removed = 0
+    for path in backups[:-keep] if keep > 0 else []:
+        path.unlink()
+        removed += 1
+    return removed
+
+async def backup_database(directory=BACKUP_DIR, pages=BACKUP_PAGES_PER_STEP,
+                          sleep=BACKUP_STEP_SLEEP, compress=BACKUP_GZIP, keep=BACKUP_RETENTION):
+    """Take an online backup of the database and rotate old copies.
+
+    Returns the backup path together with its page count, duration and
+    throughput so backup cost can be tracked as the database grows.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    target = directory / f"{BACKUP_PREFIX}{timestamp}.db"
+    partial = target.with_name(target.name + ".partial")
+
+    started = time.monotonic()
+    try:
+        progress = await asyncio.to_thread(_online_backup, partial, pages, sleep)
+        partial.rename(target)
+    except Exception:
+        # Don't leave a half-written copy behind for every failed run
+        partial.unlink(missing_ok=True)
+        raise
+    copy_seconds = time.monotonic() - started
+
+    if compress:
+        target = await asyncio.to_thread(_gzip_file, target)
+    removed = await asyncio.to_thread(_rotate, directory, keep)
+
+    duration = time.monotonic() - started
+    report = {
+        'path': str(target),
+        'pages': progress['pages'],
+        'steps': progress['steps'],
+        'duration': round(duration, 3),
+        'pages_per_sec': round(progress['pages'] / copy_seconds, 1) if copy_seconds > 0 else progress['pages'],
+        'size': target.stat().st_size,
+        'removed': removed,
+    }
+    logger.info(
+        f"Database backed up to {report['path']}: {report['pages']} pages in {report['steps']} steps, "
+        f"{report['duration']}s ({report['pages_per_sec']} pages/sec), {report['size']} bytes"
+    )
+    return report
@@ -0,0 +1,188 @@
+import os
+import time
+from collections import OrderedDict
+
+# Safety-net lifetime for cached leaderboards, in seconds
+LEADERBOARD_CACHE_TTL = int(os.getenv("LEADERBOARD_CACHE_TTL", "120"))
+# Cached user profiles: how many, and how long (names can change without a stats write)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "5000"))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "600"))
+
+def _level_value(row):
+    return (row.get('level') or 0, row.get('experience_points') or 0)
+
+# Value each leaderboard category orders rows by
+CATEGORY_VALUES = {
+    'wins': lambda row: row.get('total_wins') or 0,
+    'challenge_wins': lambda row: row.get('challenge_wins') or 0,
+    'level': _level_value,
+    'games': lambda row: row.get('total_games') or 0,
+}
+
+class _Entry:
+    __slots__ = ('rows', 'user_ids', 'floor', 'expires', 'rendered')
+
+    def __init__(self, rows, limit, value_of, ttl):
+        self.rows = rows
+        self.user_ids = {row['user_id'] for row in rows}
+        # Value a player must reach to enter a full top-N; None while not full
+        self.floor = value_of(rows[-1]) if rows and len(rows) >= limit else None
+        self.expires = time.monotonic() + ttl
+        self.rendered = {}
+
+class LeaderboardCache:
+    """Leaderboard rows and formatted output keyed by (scope, group_id, category, limit).
+
+    Entries are dropped only when a stats change could alter the cached
+    top-N: the player is already listed, or their new value reaches the
+    current Nth entry. The TTL catches anything else (e.g. renames).
+    """
+
+    def __init__(self, ttl=LEADERBOARD_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.rendered_hits = 0
+        self.invalidations = 0
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def get_rows(self, scope, group_id, category, limit):
+        entry = self._live((scope, group_id, category, limit))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.rows
+
+    def put_rows(self, scope, group_id, category, limit, rows, version):
+        """Store freshly read rows unless something was invalidated since ``version``."""
+        if version != self.version:
+            return
+        value_of = CATEGORY_VALUES[category]
+        self._entries[(scope, group_id, category, limit)] = _Entry(rows, limit, value_of, self.ttl)
+
+    def get_rendered(self, scope, group_id, category, limit, view):
+        entry = self._live((scope, group_id, category, limit))
+        if entry is None or view not in entry.rendered:
+            return None
+        self.rendered_hits += 1
+        return entry.rendered[view]
+
+    def put_rendered(self, scope, group_id, category, limit, view, rendered):
+        entry = self._live((scope, group_id, category, limit))
+        if entry is not None:
+            entry.rendered[view] = rendered
+
+    def _invalidate(self, key):
+        del self._entries[key]
+        self.version += 1
+        self.invalidations += 1
+
+    def _check(self, key, entry, user_id, value):
+        if user_id in entry.user_ids or entry.floor is None or value >= entry.floor:
+            self._invalidate(key)
+
+    def notify_stats(self, user_id, row):
+        """React to a player's new global stats row."""
+        for key, entry in list(self._entries.items()):
+            scope, _, category, _ = key
+            # Group boards rank by in-group results except for levels
+            if scope == 'group' and category != 'level':
+                continue
+            self._check(key, entry, user_id, CATEGORY_VALUES[category](row))
+
+    def notify_group(self, group_id, user_id, row):
+        """React to a player's new group_stats row (``wins``/``games``)."""
+        values = {
+            'wins': row['wins'],
+            'challenge_wins': row['wins'],
+            'games': row['games'],
+        }
+        for key, entry in list(self._entries.items()):
+            scope, key_group_id, category, _ = key
+            if scope == 'group' and key_group_id == group_id and category in values:
+                self._check(key, entry, user_id, values[category])
+
+    def invalidate_group(self, group_id):
+        for key in [key for key in self._entries if key[0] == 'group' and key[1] == group_id]:
+            self._invalidate(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.version += 1
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'rendered_hits': self.rendered_hits,
+            'invalidations': self.invalidations,
+        }
+
+
+# Shared cache used by the leaderboard helpers and handlers
+leaderboard_cache = LeaderboardCache()
+
+
+class ProfileCache:
+    """Per-user profile rows, least recently used evicted first.
+
+    Stats writers call ``invalidate`` for the users they touch; a read that
+    started before an invalidation doesn't store its (possibly stale) row.
+    """
+
+    def __init__(self, size=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[0]
+
+    def peek(self, user_id):
+        """Cached row without touching counters or recency."""
+        entry = self._entries.get(user_id)
+        return entry[0] if entry is not None else None
+
+    def put(self, user_id, profile, version):
+        if version != self.version:
+            return
+        self._entries[user_id] = (profile, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+        self.version += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.version += 1
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Shared cache used by the profile helpers
+profile_cache = ProfileCache()
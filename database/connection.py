@@ -1,35 +1,147 @@
-import sqlite3
+import asyncio
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 import aiosqlite
+from database.ranks import rank_index
+from database.cache import leaderboard_cache, profile_cache
+from database.move_model import MoveModel, move_models
+from database.migrations import run_migrations
 from datetime import datetime, timedelta
 from pathlib import Path
-import shutil
+import logging
+import logging.handlers
 import os
+import queue
 
 # Use absolute path for database file
 DB_DIR = Path("data")  
 DB_DIR.mkdir(exist_ok=True)  # Ensure proper permissions
 DB_PATH = DB_DIR / "trihand.db"
 
-@asynccontextmanager
-async def get_db_connection():
-    """Provide a persistent database connection."""
-    # Configure SQLite for better durability
+# Number of read-only connections kept open next to the single writer
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))
+
+async def _open_connection(isolation_level):
+    """Open a connection to the database and apply the per-connection PRAGMAs."""
     conn = await aiosqlite.connect(
         str(DB_PATH),
-        isolation_level="IMMEDIATE",  # Better transaction control
+        isolation_level=isolation_level,
         timeout=30,  # Longer timeout for busy conditions
     )
-    
-    try:
-        # Enable WAL mode for better concurrency
-        await conn.execute("PRAGMA journal_mode=WAL")
-        await conn.execute("PRAGMA synchronous=NORMAL")
-        conn.row_factory = aiosqlite.Row
-        yield conn
-    finally:
-        # Ensure connection is properly closed
-        await conn.close()
+    # Enable WAL mode for better concurrency
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    conn.row_factory = aiosqlite.Row
+    return conn
+
+class ConnectionPool:
+    """Long-lived connections: one serialized writer and a bounded set of readers."""
+
+    def __init__(self, readers=DB_READER_POOL_SIZE):
+        self.size = max(1, readers)
+        self._writer = None
+        self._writer_lock = asyncio.Lock()
+        self._writer_owner = None
+        self._readers = asyncio.Queue()
+        self._all_readers = []
+        self.closed = False
+
+    async def open(self):
+        # IMMEDIATE takes the write lock up front instead of upgrading mid-transaction
+        self._writer = await _open_connection("IMMEDIATE")
+        for _ in range(self.size):
+            conn = await _open_connection(None)
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+
+    async def close(self):
+        """Close every connection, waiting for borrowed ones to be returned first."""
+        self.closed = True
+        async with self._writer_lock:
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+        for _ in range(len(self._all_readers)):
+            conn = await self._readers.get()
+            await conn.close()
+        self._all_readers.clear()
+
+    def _check_open(self):
+        if self.closed:
+            raise RuntimeError("Database pool is closed")
+
+    @asynccontextmanager
+    async def writer(self):
+        self._check_open()
+        task = asyncio.current_task()
+        if self._writer_owner is task:
+            # Nested use from the same task shares the outer transaction
+            yield self._writer
+            return
+        async with self._writer_lock:
+            self._check_open()
+            self._writer_owner = task
+            try:
+                yield self._writer
+            finally:
+                self._writer_owner = None
+                # Never leak an uncommitted transaction to the next caller
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+
+    @asynccontextmanager
+    async def reader(self):
+        self._check_open()
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+_pool = None
+_pool_lock = asyncio.Lock()
+_pool_closed = False
+
+async def init_db_pool():
+    """Open the connection pool once; later calls are no-ops.
+
+    Raises RuntimeError once the pool has been closed, so nothing reopens
+    the database after shutdown.
+    """
+    global _pool
+    async with _pool_lock:
+        if _pool_closed:
+            raise RuntimeError("Database pool is closed")
+        if _pool is None:
+            os.makedirs(DB_DIR, exist_ok=True)
+            pool = ConnectionPool()
+            await pool.open()
+            _pool = pool
+    return _pool
+
+async def close_db_pool():
+    """Close all pooled connections (called on shutdown); safe to call twice."""
+    global _pool, _pool_closed
+    async with _pool_lock:
+        _pool_closed = True
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+@asynccontextmanager
+async def get_db_connection(readonly=False):
+    """Borrow a pooled database connection.
+
+    Writes go through the single writer connection, one caller at a time;
+    pass ``readonly=True`` for queries that only read.
+    """
+    pool = _pool or await init_db_pool()
+    if readonly:
+        async with pool.reader() as conn:
+            yield conn
+    else:
+        async with pool.writer() as conn:
+            yield conn
 
 
 async def is_admin(user_id):
@@ -37,152 +149,80 @@ async def is_admin(user_id):
     # Replace with your admin IDs
     return user_id in [5956598856]  # Update with actual admin IDs
 
+_schema_version = None
+
 async def ensure_tables_exist():
-    os.makedirs(DB_DIR, exist_ok=True)
+    """Bring the schema up to date; runs the migrations once per process."""
+    global _schema_version
+    if _schema_version is not None:
+        return _schema_version
+    await init_db_pool()
     async with get_db_connection() as conn:
-        try:
-            # Users table
-            await conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                first_name TEXT NOT NULL,
-                last_name TEXT,
-                username TEXT,
-                joined_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                last_active TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-            ''')
-
-            # Groups table
-            await conn.execute('''
-            CREATE TABLE IF NOT EXISTS groups (
-                group_id INTEGER PRIMARY KEY,
-                title TEXT NOT NULL,
-                username TEXT,
-                joined_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                last_active TEXT DEFAULT CURRENT_TIMESTAMP,
-                member_count INTEGER DEFAULT 0
-            )
-            ''')
-
-            # Challenge stats table
-            await conn.execute('''
-            CREATE TABLE IF NOT EXISTS stats (
-                user_id INTEGER PRIMARY KEY,
-                total_games INTEGER DEFAULT 0,
-                total_wins INTEGER DEFAULT 0,
-                total_losses INTEGER DEFAULT 0,
-                challenge_ties INTEGER DEFAULT 0,
-                challenge_games INTEGER DEFAULT 0,
-                challenge_wins INTEGER DEFAULT 0,
-                challenge_losses INTEGER DEFAULT 0,
-                rock_played INTEGER DEFAULT 0,
-                paper_played INTEGER DEFAULT 0,
-                scissor_played INTEGER DEFAULT 0,
-                experience_points INTEGER DEFAULT 0,
-                level INTEGER DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-
-            # Bot stats table
-            await conn.execute('''
-            CREATE TABLE IF NOT EXISTS bot_stats (
-                user_id INTEGER PRIMARY KEY,
-                total_games INTEGER DEFAULT 0,
-                total_wins INTEGER DEFAULT 0,
-                total_losses INTEGER DEFAULT 0,
-                total_ties INTEGER DEFAULT 0,
-                rock_played INTEGER DEFAULT 0,
-                paper_played INTEGER DEFAULT 0,
-                scissor_played INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-
-            # Game history table
-            await conn.execute('''
-            CREATE TABLE IF NOT EXISTS game_history (
-                game_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                player1_id INTEGER NOT NULL,
-                player2_id INTEGER,
-                winner_id INTEGER,
-                game_type TEXT CHECK(game_type IN ('challenge', 'bot')) NOT NULL,
-                rounds INTEGER DEFAULT 1,
-                date_played TEXT DEFAULT CURRENT_TIMESTAMP,
-                group_id INTEGER,
-                FOREIGN KEY (player1_id) REFERENCES users(user_id),
-                FOREIGN KEY (player2_id) REFERENCES users(user_id),
-                FOREIGN KEY (winner_id) REFERENCES users(user_id),
-                FOREIGN KEY (group_id) REFERENCES groups(group_id)
-            )
-            ''')
-
-            # Round details table
-            await conn.execute('''
-            CREATE TABLE IF NOT EXISTS round_details (
-                round_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                game_id INTEGER NOT NULL,
-                round_number INTEGER NOT NULL,
-                player1_move TEXT CHECK(player1_move IN ('rock', 'paper', 'scissor')) NOT NULL,
-                player2_move TEXT CHECK(player2_move IN ('rock', 'paper', 'scissor')) NOT NULL,
-                winner_id INTEGER,
-                FOREIGN KEY (game_id) REFERENCES game_history(game_id),
-                FOREIGN KEY (winner_id) REFERENCES users(user_id)
-            )
-            ''')
-
-            # Achievements table
-            await conn.execute('''
-            CREATE TABLE IF NOT EXISTS achievements (
-                achievement_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                achievement_type TEXT CHECK(achievement_type IN (
-                    'first_win', 'first_bot_game', 'first_bot_win', 'perfect_victory',
-                    'veteran', 'comeback', 'lucky', 'streak_winner', 'move_master'
-                )) NOT NULL,
-                achievement_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                description TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-
-            # User progress table for achievement tracking
-            await conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_progress (
-                user_id INTEGER PRIMARY KEY,
-                win_streak INTEGER DEFAULT 0,
-                last_move TEXT CHECK(last_move IN ('rock', 'paper', 'scissor', '')) DEFAULT '',
-                move_streak INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-
-            # Create indexes for performance
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_group ON game_history(group_id, game_type)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_players ON game_history(player1_id, player2_id)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_date ON game_history(date_played)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_stats_ranking ON stats(total_wins, level, experience_points)')
+        _schema_version = await run_migrations(conn)
+    print(f"Database schema at version {_schema_version}")
+    return _schema_version
 
-            await conn.commit()
-            print("All tables and indexes created successfully!")
-        except sqlite3.Error as e:
-            print(f"Error creating tables: {e}")
+# Activity refreshes are coalesced in memory and written in batches
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv("ACTIVITY_FLUSH_INTERVAL", "30"))  # seconds
+ACTIVITY_FLUSH_SIZE = int(os.getenv("ACTIVITY_FLUSH_SIZE", "500"))
+KNOWN_USERS_SIZE = int(os.getenv("KNOWN_USERS_SIZE", "50000"))
+_pending_users = {}
+_pending_groups = {}
+# LRU of users whose rows are known to exist; a forgotten user just gets the full upsert again
+_known_users = OrderedDict()
+
+def _is_known_user(user_id):
+    if user_id not in _known_users:
+        return False
+    _known_users.move_to_end(user_id)
+    return True
+
+def _remember_user(user_id):
+    _known_users[user_id] = None
+    _known_users.move_to_end(user_id)
+    while len(_known_users) > KNOWN_USERS_SIZE:
+        _known_users.popitem(last=False)
+
+ROUND_INSERT_SQL = '''
+    INSERT INTO round_details
+    (game_id, round_number, player1_move, player2_move, winner_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+USER_UPSERT_SQL = '''
+    INSERT INTO users (user_id, first_name, last_name, username, last_active)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        username = excluded.username,
+        last_active = excluded.last_active
+'''
+
+GROUP_UPSERT_SQL = '''
+    INSERT INTO groups (group_id, title, username, last_active, member_count)
+    VALUES (?, ?, ?, ?, COALESCE(?, 0))
+    ON CONFLICT(group_id) DO UPDATE SET
+        title = excluded.title,
+        username = excluded.username,
+        last_active = excluded.last_active,
+        member_count = COALESCE(excluded.member_count, member_count)
+'''
 
 async def update_user_activity(user_id, first_name, last_name=None, username=None):
     """Update user information and last active timestamp."""
     current_time = datetime.now().isoformat()
+    row = (user_id, first_name, last_name or "", username or "", current_time)
+    
+    if _is_known_user(user_id):
+        # Known user: only names and last_active change, so defer the write
+        _pending_users[user_id] = row
+        if len(_pending_users) + len(_pending_groups) >= ACTIVITY_FLUSH_SIZE:
+            await flush_activity()
+        return
     
     async with get_db_connection() as conn:
-        await conn.execute('''
-            INSERT INTO users (user_id, first_name, last_name, username, last_active)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                first_name = excluded.first_name,
-                last_name = excluded.last_name,
-                username = excluded.username,
-                last_active = excluded.last_active
-        ''', (user_id, first_name, last_name or "", username or "", current_time))
+        await conn.execute(USER_UPSERT_SQL, row)
         
         # Initialize stats for challenge mode
         await conn.execute('''
@@ -206,213 +246,269 @@ async def update_user_activity(user_id, first_name, last_name=None, username=Non
         ''', (user_id,))
         
         await conn.commit()
+    _remember_user(user_id)
 
 async def update_group_activity(group_id, title, username=None, member_count=None):
     """Update group information and last active timestamp."""
     current_time = datetime.now().isoformat()
     
-    async with get_db_connection() as conn:
-        await conn.execute('''
-            INSERT INTO groups (group_id, title, username, last_active, member_count)
-            VALUES (?, ?, ?, ?, COALESCE(?, 0))
-            ON CONFLICT(group_id) DO UPDATE SET
-                title = excluded.title,
-                username = excluded.username,
-                last_active = excluded.last_active,
-                member_count = COALESCE(excluded.member_count, member_count)
-        ''', (group_id, title, username or "", current_time, member_count))
-        
-        await conn.commit()
+    pending = _pending_groups.get(group_id)
+    if member_count is None and pending is not None:
+        # Keep a member count queued by an earlier update
+        member_count = pending[4]
+    _pending_groups[group_id] = (group_id, title, username or "", current_time, member_count)
+    if len(_pending_users) + len(_pending_groups) >= ACTIVITY_FLUSH_SIZE:
+        await flush_activity()
+
+async def flush_activity():
+    """Write all queued user and group activity in one transaction."""
+    if not _pending_users and not _pending_groups:
+        return 0
+    
+    users = list(_pending_users.values())
+    groups = list(_pending_groups.values())
+    _pending_users.clear()
+    _pending_groups.clear()
+    
+    try:
+        async with get_db_connection() as conn:
+            if users:
+                await conn.executemany(USER_UPSERT_SQL, users)
+            if groups:
+                await conn.executemany(GROUP_UPSERT_SQL, groups)
+            await conn.commit()
+    except Exception:
+        # Requeue, without clobbering anything newer that arrived meanwhile
+        for row in users:
+            _pending_users.setdefault(row[0], row)
+        for row in groups:
+            _pending_groups.setdefault(row[0], row)
+        raise
+    
+    # Drop cached profiles showing a name that just changed
+    for user_id, first_name, last_name, username, _ in users:
+        cached = profile_cache.peek(user_id)
+        if cached is not None and (cached['first_name'], cached['last_name'], cached['username']) != (first_name, last_name, username):
+            profile_cache.invalidate(user_id)
+    
+    return len(users) + len(groups)
+
+def discard_pending_activity(user_id=None, group_id=None):
+    """Drop queued activity for deleted rows; with no arguments drop everything."""
+    if user_id is None and group_id is None:
+        _pending_users.clear()
+        _pending_groups.clear()
+        _known_users.clear()
+        return
+    if user_id is not None:
+        _pending_users.pop(user_id, None)
+        _known_users.pop(user_id, None)
+    if group_id is not None:
+        _pending_groups.pop(group_id, None)
+
+async def load_move_model(user_id):
+    """Smart-bot model of a player, read from the database on a cache miss."""
+    model = move_models.get(user_id)
+    if model is not None:
+        return model
+    async with get_db_connection(readonly=True) as conn:
+        async with conn.execute('SELECT model FROM move_models WHERE user_id = ?', (user_id,)) as cursor:
+            row = await cursor.fetchone()
+    # Another handler may have loaded it while we waited
+    model = move_models.get(user_id)
+    if model is None:
+        model = move_models.put(user_id, MoveModel.from_blob(row['model']) if row else MoveModel())
+    return model
+
+async def flush_move_models():
+    """Write every updated move model in one transaction."""
+    rows = move_models.take_dirty()
+    if not rows:
+        return 0
+    
+    try:
+        async with get_db_connection() as conn:
+            await conn.executemany('''
+                INSERT INTO move_models (user_id, model) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    model = excluded.model,
+                    updated = CURRENT_TIMESTAMP
+            ''', rows)
+            await conn.commit()
+    except Exception:
+        move_models.requeue(rows)
+        raise
+    
+    return len(rows)
+
+async def flush_pending_writes():
+    """Flush every write-behind buffer (timer job and shutdown)."""
+    if _pool_closed:
+        # Shutdown already flushed and closed the database
+        return
+    await flush_activity()
+    await flush_move_models()
 
 async def remove_group(group_id):
     """Remove a group when the bot is kicked or removed."""
+    discard_pending_activity(group_id=group_id)
+    leaderboard_cache.invalidate_group(group_id)
     async with get_db_connection() as conn:
         await conn.execute('DELETE FROM groups WHERE group_id = ?', (group_id,))
+        await conn.execute('DELETE FROM group_stats WHERE group_id = ?', (group_id,))
         await conn.execute('UPDATE game_history SET group_id = NULL WHERE group_id = ?', (group_id,))
         await conn.commit()
     print(f"Group ID {group_id} removed from database.")
     
 
-async def update_stats(user_id, game_type, result, move=None):
-    """Update user challenge mode statistics after a game."""
-    if game_type != 'challenge':
-        return False, 1
-    
-    async with get_db_connection() as conn:
-        # Fetch current stats
-        async with conn.execute('SELECT * FROM stats WHERE user_id = ?', (user_id,)) as cursor:
-            stats = await cursor.fetchone()
-            
-            if not stats:
-                await conn.execute('''
-                    INSERT INTO stats (user_id) VALUES (?)
-                ''', (user_id,))
-                stats = {
-                    'total_games': 0, 'total_wins': 0, 'total_losses': 0, 'challenge_ties': 0,
-                    'challenge_games': 0, 'challenge_wins': 0, 'challenge_losses': 0,
-                    'rock_played': 0, 'paper_played': 0, 'scissor_played': 0,
-                    'experience_points': 0, 'level': 1
-                }
-        
-        # Update move counts
-        if move:
-            if move == 'rock':
-                rock_played = stats['rock_played'] + 1
-                await conn.execute('UPDATE stats SET rock_played = ? WHERE user_id = ?', 
-                                (rock_played, user_id))
-            elif move == 'paper':
-                paper_played = stats['paper_played'] + 1
-                await conn.execute('UPDATE stats SET paper_played = ? WHERE user_id = ?', 
-                                (paper_played, user_id))
-            elif move == 'scissor':
-                scissor_played = stats['scissor_played'] + 1
-                await conn.execute('UPDATE stats SET scissor_played = ? WHERE user_id = ?', 
-                                (scissor_played, user_id))
-        
-        # Update game stats
-        total_games = stats['total_games'] + 1
-        challenge_games = stats['challenge_games'] + 1
-        experience_points = stats['experience_points']
-        
-        # Update result stats
-        xp_gain = 0
-        if result == 'win':
-            total_wins = stats['total_wins'] + 1
-            challenge_wins = stats['challenge_wins'] + 1
-            xp_gain = 15
-            await conn.execute('UPDATE stats SET total_wins = ?, challenge_wins = ? WHERE user_id = ?', 
-                            (total_wins, challenge_wins, user_id))
-        elif result == 'loss':
-            total_losses = stats['total_losses'] + 1
-            challenge_losses = stats['challenge_losses'] + 1
-            xp_gain = 3
-            await conn.execute('UPDATE stats SET total_losses = ?, challenge_losses = ? WHERE user_id = ?', 
-                            (total_losses, challenge_losses, user_id))
-        elif result == 'tie':
-            challenge_ties = stats['challenge_ties'] + 1
-            xp_gain = 5
-            await conn.execute('UPDATE stats SET challenge_ties = ? WHERE user_id = ?', 
-                            (challenge_ties, user_id))
-        
-        # Update total games, challenge games, and XP
-        experience_points += xp_gain
-        level = calculate_level(experience_points)
-        
-        await conn.execute('''
-            UPDATE stats SET 
-                total_games = ?,
-                challenge_games = ?,
-                experience_points = ?,
-                level = ?
-            WHERE user_id = ?
-        ''', (total_games, challenge_games, experience_points, level, user_id))
-        
-        await conn.commit()
-        
-        if level > stats['level']:
-            return True, level
-        return False, level
+# XP awarded per challenge/bot result
+XP_REWARDS = {'win': 15, 'loss': 3, 'tie': 5}
 
-async def update_bot_stats(user_id, result, move=None):
-    """Update user bot game statistics after a game."""
-    async with get_db_connection() as conn:
-        async with conn.execute('SELECT * FROM bot_stats WHERE user_id = ?', (user_id,)) as cursor:
-            stats = await cursor.fetchone()
-            
-            if not stats:
-                await conn.execute('''
-                    INSERT INTO bot_stats (user_id) VALUES (?)
-                ''', (user_id,))
-                stats = {
-                    'total_games': 0,
-                    'total_wins': 0,
-                    'total_losses': 0,
-                    'total_ties': 0,
-                    'rock_played': 0,
-                    'paper_played': 0,
-                    'scissor_played': 0
-                }
-        
-        if move:
-            if move == 'rock':
-                rock_played = stats['rock_played'] + 1
-                await conn.execute('UPDATE bot_stats SET rock_played = ? WHERE user_id = ?', 
-                                (rock_played, user_id))
-            elif move == 'paper':
-                paper_played = stats['paper_played'] + 1
-                await conn.execute('UPDATE bot_stats SET paper_played = ? WHERE user_id = ?', 
-                                (paper_played, user_id))
-            elif move == 'scissor':
-                scissor_played = stats['scissor_played'] + 1
-                await conn.execute('UPDATE bot_stats SET scissor_played = ? WHERE user_id = ?', 
-                                (scissor_played, user_id))
-        
-        total_games = stats['total_games'] + 1
-        
-        if result == 'win':
-            total_wins = stats['total_wins'] + 1
-            await conn.execute('UPDATE bot_stats SET total_wins = ? WHERE user_id = ?', 
-                            (total_wins, user_id))
-        elif result == 'loss':
-            total_losses = stats['total_losses'] + 1
-            await conn.execute('UPDATE bot_stats SET total_losses = ? WHERE user_id = ?', 
-                            (total_losses, user_id))
-        elif result == 'tie':
-            total_ties = stats['total_ties'] + 1
-            await conn.execute('UPDATE bot_stats SET total_ties = ? WHERE user_id = ?', 
-                            (total_ties, user_id))
-        
-        await conn.execute('UPDATE bot_stats SET total_games = ? WHERE user_id = ?', 
-                         (total_games, user_id))
-        
-        await conn.commit()
+def _level_sql(xp):
+    """SQL expression mirroring calculate_level() for the given XP expression."""
+    return f'''CASE
+                WHEN {xp} < 100 THEN 1
+                WHEN {xp} < 250 THEN 2
+                WHEN {xp} < 450 THEN 3
+                WHEN {xp} < 700 THEN 4
+                WHEN {xp} < 1000 THEN 5
+                ELSE 5 + ({xp} - 1000) / 500
+            END'''
 
-async def update_user_progress(user_id, result, move=None):
-    """Update user progress for achievement tracking."""
-    async with get_db_connection() as conn:
-        # Fetch current progress
-        async with conn.execute('SELECT * FROM user_progress WHERE user_id = ?', (user_id,)) as cursor:
-            progress = await cursor.fetchone()
-            
-            if not progress:
-                await conn.execute('''
-                    INSERT INTO user_progress (user_id) VALUES (?)
-                ''', (user_id,))
-                progress = {'win_streak': 0, 'last_move': '', 'move_streak': 0}
-        
-        # Update win streak
-        win_streak = progress['win_streak']
-        if result == 'win':
-            win_streak += 1
-        else:
-            win_streak = 0
-        
-        # Update move streak
-        last_move = progress['last_move']
-        move_streak = progress['move_streak']
+def _move_counts(moves):
+    """Count rock/paper/scissor picks in a sequence of moves."""
+    return tuple(sum(1 for move in moves if move == choice) for choice in ('rock', 'paper', 'scissor'))
+
+async def _apply_challenge_stats(conn, user_id, result, move_counts=(0, 0, 0)):
+    """Add one game and its move counts to a user's challenge stats; returns the new row."""
+    xp_gain = XP_REWARDS.get(result, 0)
+    values = (
+        user_id,
+        1 if result == 'win' else 0,
+        1 if result == 'loss' else 0,
+        1 if result == 'tie' else 0,
+        *move_counts,
+        xp_gain,
+        calculate_level(xp_gain),
+    )
+    async with conn.execute(f'''
+        INSERT INTO stats (
+            user_id, total_games, challenge_games,
+            total_wins, challenge_wins, total_losses, challenge_losses, challenge_ties,
+            rock_played, paper_played, scissor_played, experience_points, level
+        )
+        VALUES (?1, 1, 1, ?2, ?2, ?3, ?3, ?4, ?5, ?6, ?7, ?8, ?9)
+        ON CONFLICT(user_id) DO UPDATE SET
+            total_games = total_games + 1,
+            challenge_games = challenge_games + 1,
+            total_wins = total_wins + excluded.total_wins,
+            challenge_wins = challenge_wins + excluded.challenge_wins,
+            total_losses = total_losses + excluded.total_losses,
+            challenge_losses = challenge_losses + excluded.challenge_losses,
+            challenge_ties = challenge_ties + excluded.challenge_ties,
+            rock_played = rock_played + excluded.rock_played,
+            paper_played = paper_played + excluded.paper_played,
+            scissor_played = scissor_played + excluded.scissor_played,
+            experience_points = experience_points + excluded.experience_points,
+            level = {_level_sql('(experience_points + excluded.experience_points)')}
+        RETURNING total_games, total_wins, challenge_wins, experience_points, level
+    ''', values) as cursor:
+        row = dict(await cursor.fetchone())
+    row['level_up'] = row['level'] > calculate_level(row['experience_points'] - xp_gain)
+    return row
+
+async def _apply_bot_stats(conn, user_id, result, move_counts=(0, 0, 0)):
+    """Add one bot game and its move counts to a user's counters; returns the new row."""
+    values = (
+        user_id,
+        1 if result == 'win' else 0,
+        1 if result == 'loss' else 0,
+        1 if result == 'tie' else 0,
+        *move_counts,
+    )
+    async with conn.execute('''
+        INSERT INTO bot_stats (
+            user_id, total_games, total_wins, total_losses, total_ties,
+            rock_played, paper_played, scissor_played
+        )
+        VALUES (?, 1, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            total_games = total_games + 1,
+            total_wins = total_wins + excluded.total_wins,
+            total_losses = total_losses + excluded.total_losses,
+            total_ties = total_ties + excluded.total_ties,
+            rock_played = rock_played + excluded.rock_played,
+            paper_played = paper_played + excluded.paper_played,
+            scissor_played = scissor_played + excluded.scissor_played
+        RETURNING total_games, total_wins, total_losses, total_ties,
+                  rock_played, paper_played, scissor_played
+    ''', values) as cursor:
+        return dict(await cursor.fetchone())
+
+async def _apply_group_stats(conn, group_id, user_id, result):
+    """Count a finished challenge game towards a player's in-group record."""
+    async with conn.execute('''
+        INSERT INTO group_stats (group_id, user_id, wins, losses, ties, games, last_played)
+        VALUES (?, ?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT(group_id, user_id) DO UPDATE SET
+            wins = wins + excluded.wins,
+            losses = losses + excluded.losses,
+            ties = ties + excluded.ties,
+            games = games + 1,
+            last_played = excluded.last_played
+        RETURNING wins, games
+    ''', (
+        group_id,
+        user_id,
+        1 if result == 'win' else 0,
+        1 if result == 'loss' else 0,
+        1 if result == 'tie' else 0,
+    )) as cursor:
+        return dict(await cursor.fetchone())
+
+async def _apply_user_progress(conn, user_id, result, move=None):
+    """Advance a user's win and move streaks inside an open transaction."""
+    # Fetch current progress
+    async with conn.execute('SELECT * FROM user_progress WHERE user_id = ?', (user_id,)) as cursor:
+        progress = await cursor.fetchone()
         
-        if move and move in ('rock', 'paper', 'scissor'):
-            if last_move == move:
-                move_streak += 1
-            else:
-                move_streak = 1
-            last_move = move
+        if not progress:
+            await conn.execute('''
+                INSERT INTO user_progress (user_id) VALUES (?)
+            ''', (user_id,))
+            progress = {'win_streak': 0, 'last_move': '', 'move_streak': 0}
+    
+    # Update win streak
+    win_streak = progress['win_streak']
+    if result == 'win':
+        win_streak += 1
+    else:
+        win_streak = 0
+    
+    # Update move streak
+    last_move = progress['last_move']
+    move_streak = progress['move_streak']
+    
+    if move and move in ('rock', 'paper', 'scissor'):
+        if last_move == move:
+            move_streak += 1
         else:
-            move_streak = 0
-            last_move = ''
-        
-        # Update progress
-        await conn.execute('''
-            UPDATE user_progress SET
-                win_streak = ?,
-                last_move = ?,
-                move_streak = ?
-            WHERE user_id = ?
-        ''', (win_streak, last_move, move_streak, user_id))
-        
-        await conn.commit()
-        
-        return {'win_streak': win_streak, 'move_streak': move_streak}
+            move_streak = 1
+        last_move = move
+    else:
+        move_streak = 0
+        last_move = ''
+    
+    # Update progress
+    await conn.execute('''
+        UPDATE user_progress SET
+            win_streak = ?,
+            last_move = ?,
+            move_streak = ?
+        WHERE user_id = ?
+    ''', (win_streak, last_move, move_streak, user_id))
+    
+    return {'win_streak': win_streak, 'move_streak': move_streak}
 
 def calculate_level(xp):
     """Calculate user level based on experience points."""
@@ -429,16 +525,6 @@ def calculate_level(xp):
     else:
         return 5 + (xp - 1000) // 500
 
-async def record_round(game_id, round_number, player1_move, player2_move, winner_id=None):
-    """Record details of an individual round."""
-    async with get_db_connection() as conn:
-        await conn.execute('''
-            INSERT INTO round_details 
-            (game_id, round_number, player1_move, player2_move, winner_id) 
-            VALUES (?, ?, ?, ?, ?)
-        ''', (game_id, round_number, player1_move, player2_move, winner_id))
-        await conn.commit()
-
 async def record_game(player1_id, player2_id, winner_id, game_type, rounds, group_id=None):
     """Record a completed game in the history."""
     async with get_db_connection() as conn:
@@ -484,176 +570,184 @@ async def get_leaderboard(category='wins', limit=10):
         '''
     }
     
-    query = query_map.get(category, query_map['wins'])
+    if category not in query_map:
+        category = 'wins'
+    cached = leaderboard_cache.get_rows('global', None, category, limit)
+    if cached is not None:
+        return cached
+    version = leaderboard_cache.version
     
-    async with get_db_connection() as conn:
-        async with conn.execute(query, (limit,)) as cursor:
-            results = await cursor.fetchall()
-            return [dict(result) for result in results]
+    async with get_db_connection(readonly=True) as conn:
+        async with conn.execute(query_map[category], (limit,)) as cursor:
+            results = [dict(result) for result in await cursor.fetchall()]
+    leaderboard_cache.put_rows('global', None, category, limit, results, version)
+    return results
 
 async def get_group_leaderboard(group_id: int, category: str, limit: int = 10) -> list:
     """Get the leaderboard for users who played in a specific group."""
     query_map = {
         'wins': '''
-            SELECT u.user_id, u.first_name, u.last_name, s.total_wins, s.level, s.experience_points
-            FROM users u
-            JOIN stats s ON u.user_id = s.user_id
-            WHERE u.user_id IN (
-                SELECT DISTINCT player1_id FROM game_history WHERE group_id = ? AND game_type = 'challenge'
-                UNION
-                SELECT DISTINCT player2_id FROM game_history WHERE group_id = ? AND game_type = 'challenge' AND player2_id IS NOT NULL
-            )
-            ORDER BY s.total_wins DESC
+            SELECT u.user_id, u.first_name, u.last_name, g.wins AS total_wins, s.level, s.experience_points
+            FROM group_stats g
+            JOIN users u ON u.user_id = g.user_id
+            LEFT JOIN stats s ON s.user_id = g.user_id
+            WHERE g.group_id = ?
+            ORDER BY g.wins DESC
             LIMIT ?
         ''',
         'challenge_wins': '''
-            SELECT u.user_id, u.first_name, u.last_name, s.challenge_wins, s.level, s.experience_points
-            FROM users u
-            JOIN stats s ON u.user_id = s.user_id
-            WHERE u.user_id IN (
-                SELECT DISTINCT player1_id FROM game_history WHERE group_id = ? AND game_type = 'challenge'
-                UNION
-                SELECT DISTINCT player2_id FROM game_history WHERE group_id = ? AND game_type = 'challenge' AND player2_id IS NOT NULL
-            )
-            ORDER BY s.challenge_wins DESC
+            SELECT u.user_id, u.first_name, u.last_name, g.wins AS challenge_wins, s.level, s.experience_points
+            FROM group_stats g
+            JOIN users u ON u.user_id = g.user_id
+            LEFT JOIN stats s ON s.user_id = g.user_id
+            WHERE g.group_id = ?
+            ORDER BY g.wins DESC
             LIMIT ?
         ''',
         'level': '''
             SELECT u.user_id, u.first_name, u.last_name, s.level, s.experience_points
-            FROM users u
-            JOIN stats s ON u.user_id = s.user_id
-            WHERE u.user_id IN (
-                SELECT DISTINCT player1_id FROM game_history WHERE group_id = ? AND game_type = 'challenge'
-                UNION
-                SELECT DISTINCT player2_id FROM game_history WHERE group_id = ? AND game_type = 'challenge' AND player2_id IS NOT NULL
-            )
+            FROM group_stats g
+            JOIN users u ON u.user_id = g.user_id
+            JOIN stats s ON s.user_id = g.user_id
+            WHERE g.group_id = ?
             ORDER BY s.level DESC, s.experience_points DESC
             LIMIT ?
         ''',
         'games': '''
-            SELECT u.user_id, u.first_name, u.last_name, s.total_games, s.level
-            FROM users u
-            JOIN stats s ON u.user_id = s.user_id
-            WHERE u.user_id IN (
-                SELECT DISTINCT player1_id FROM game_history WHERE group_id = ? AND game_type = 'challenge'
-                UNION
-                SELECT DISTINCT player2_id FROM game_history WHERE group_id = ? AND game_type = 'challenge' AND player2_id IS NOT NULL
-            )
-            ORDER BY s.total_games DESC
+            SELECT u.user_id, u.first_name, u.last_name, g.games AS total_games, s.level
+            FROM group_stats g
+            JOIN users u ON u.user_id = g.user_id
+            LEFT JOIN stats s ON s.user_id = g.user_id
+            WHERE g.group_id = ?
+            ORDER BY g.games DESC
             LIMIT ?
         '''
     }
     
-    query = query_map.get(category, query_map['wins'])
+    if category not in query_map:
+        category = 'wins'
+    cached = leaderboard_cache.get_rows('group', group_id, category, limit)
+    if cached is not None:
+        return cached
+    version = leaderboard_cache.version
     
-    async with get_db_connection() as conn:
-        async with conn.execute(query, (group_id, group_id, limit)) as cursor:
-            results = await cursor.fetchall()
-            return [dict(result) for result in results]
+    async with get_db_connection(readonly=True) as conn:
+        async with conn.execute(query_map[category], (group_id, limit)) as cursor:
+            results = [dict(result) for result in await cursor.fetchall()]
+    leaderboard_cache.put_rows('group', group_id, category, limit, results, version)
+    return results
+
+def _favorite_move_sql(prefix):
+    """SQL picking the most played move (ties go to rock, then paper); NULL if none."""
+    rock, paper, scissor = (f"COALESCE({prefix}.{move}_played, 0)" for move in ('rock', 'paper', 'scissor'))
+    return f'''CASE
+        WHEN {rock} + {paper} + {scissor} = 0 THEN NULL
+        WHEN {rock} >= {paper} AND {rock} >= {scissor} THEN 'rock'
+        WHEN {paper} >= {scissor} THEN 'paper'
+        ELSE 'scissor'
+    END'''
+
+def _win_rate_sql(wins, games):
+    return f"CASE WHEN {games} > 0 THEN ROUND({wins} * 100.0 / {games}, 1) ELSE 0 END"
+
+PROFILE_SQL = f'''
+    SELECT u.user_id, u.first_name, u.last_name, u.username, u.joined_date,
+           COALESCE(s.total_games, 0) AS total_games,
+           COALESCE(s.total_wins, 0) AS total_wins,
+           COALESCE(s.total_losses, 0) AS total_losses,
+           COALESCE(s.challenge_ties, 0) AS challenge_ties,
+           COALESCE(s.challenge_ties, 0) AS total_ties,
+           COALESCE(s.challenge_games, 0) AS challenge_games,
+           COALESCE(s.challenge_wins, 0) AS challenge_wins,
+           COALESCE(s.challenge_losses, 0) AS challenge_losses,
+           COALESCE(s.rock_played, 0) AS rock_played,
+           COALESCE(s.paper_played, 0) AS paper_played,
+           COALESCE(s.scissor_played, 0) AS scissor_played,
+           COALESCE(s.experience_points, 0) AS experience_points,
+           COALESCE(s.level, 1) AS level,
+           {_win_rate_sql('COALESCE(s.total_wins, 0)', 'COALESCE(s.total_games, 0)')} AS win_rate,
+           {_favorite_move_sql('s')} AS favorite_move,
+           COALESCE(b.total_games, 0) AS bot_games,
+           COALESCE(b.total_wins, 0) AS bot_wins,
+           COALESCE(b.total_losses, 0) AS bot_losses,
+           COALESCE(b.total_ties, 0) AS bot_ties,
+           {_win_rate_sql('COALESCE(b.total_wins, 0)', 'COALESCE(b.total_games, 0)')} AS bot_win_rate,
+           {_favorite_move_sql('b')} AS bot_favorite_move,
+           COALESCE(b.rock_played, 0) AS bot_rock_played,
+           COALESCE(b.paper_played, 0) AS bot_paper_played,
+           COALESCE(b.scissor_played, 0) AS bot_scissor_played,
+           COALESCE(p.win_streak, 0) AS win_streak,
+           COALESCE(p.move_streak, 0) AS move_streak,
+           p.last_move
+    FROM users u
+    LEFT JOIN stats s ON s.user_id = u.user_id
+    LEFT JOIN bot_stats b ON b.user_id = u.user_id
+    LEFT JOIN user_progress p ON p.user_id = u.user_id
+    WHERE u.user_id = ?
+'''
 
 async def get_user_stats(user_id):
-    """Get comprehensive stats for a user, including challenge and bot games."""
-    async with get_db_connection() as conn:
-        # Fetch challenge stats
-        async with conn.execute('''
-            SELECT u.first_name, u.last_name, u.username, u.joined_date,
-                   s.total_games, s.total_wins, s.total_losses, s.challenge_ties,
-                   s.challenge_games, s.challenge_wins, s.challenge_losses,
-                   s.rock_played, s.paper_played, s.scissor_played,
-                   s.experience_points, s.level
-            FROM users u
-            LEFT JOIN stats s ON u.user_id = s.user_id
-            WHERE u.user_id = ?
-        ''', (user_id,)) as cursor:
-            user_stats = await cursor.fetchone()
-            
-            if not user_stats:
-                return None
-                
-        # Fetch bot stats
-        async with conn.execute('''
-            SELECT total_games AS bot_games, total_wins AS bot_wins, total_losses AS bot_losses,
-                   total_ties AS bot_ties, rock_played AS bot_rock_played,
-                   paper_played AS bot_paper_played, scissor_played AS bot_scissor_played
-            FROM bot_stats
-            WHERE user_id = ?
-        ''', (user_id,)) as cursor:
-            bot_stats = await cursor.fetchone()
-            
-            if not bot_stats:
-                bot_stats = {
-                    'bot_games': 0,
-                    'bot_wins': 0,
-                    'bot_losses': 0,
-                    'bot_ties': 0,
-                    'bot_rock_played': 0,
-                    'bot_paper_played': 0,
-                    'bot_scissor_played': 0
-                }
-            else:
-                bot_stats = dict(bot_stats)
-        
-        # Calculate challenge mode win rate
-        total_games = user_stats['total_games']
-        win_rate = round((user_stats['total_wins'] / total_games) * 100, 1) if total_games > 0 else 0
-        
-        # Calculate bot mode win rate
-        bot_games = bot_stats['bot_games']
-        bot_win_rate = round((bot_stats['bot_wins'] / bot_games) * 100, 1) if bot_games > 0 else 0
-        
-        # Get favorite move for challenge mode
-        moves = {
-            'rock': user_stats['rock_played'],
-            'paper': user_stats['paper_played'],
-            'scissor': user_stats['scissor_played']
-        }
-        favorite_move = max(moves, key=moves.get) if sum(moves.values()) > 0 else None
-        
-        # Get favorite move for bot mode
-        bot_moves = {
-            'rock': bot_stats['bot_rock_played'],
-            'paper': bot_stats['bot_paper_played'],
-            'scissor': bot_stats['bot_scissor_played']
-        }
-        bot_favorite_move = max(bot_moves, key=bot_moves.get) if sum(bot_moves.values()) > 0 else None
-        
-        # Get position on challenge mode leaderboard
-        async with conn.execute('''
-            SELECT COUNT(*) + 1 as rank
-            FROM stats
-            WHERE total_wins > (SELECT total_wins FROM stats WHERE user_id = ?)
-        ''', (user_id,)) as rank_cursor:
-            rank = await rank_cursor.fetchone()
-                
-        result = dict(user_stats)
-        result.update({
-            'win_rate': win_rate,
-            'favorite_move': favorite_move,
-            'leaderboard_rank': rank['rank'],
-            'bot_games': bot_stats['bot_games'],
-            'bot_wins': bot_stats['bot_wins'],
-            'bot_losses': bot_stats['bot_losses'],
-            'bot_ties': bot_stats['bot_ties'],
-            'bot_win_rate': bot_win_rate,
-            'bot_favorite_move': bot_favorite_move,
-            'bot_rock_played': bot_stats['bot_rock_played'],
-            'bot_paper_played': bot_stats['bot_paper_played'],
-            'bot_scissor_played': bot_stats['bot_scissor_played']
-        })
-        
-        return result
+    """Get comprehensive stats for a user, including challenge and bot games.
+
+    The profile row comes from one query and is cached per user until a
+    stats writer invalidates it; the leaderboard rank is added on every read.
+    """
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        version = profile_cache.version
+        async with get_db_connection(readonly=True) as conn:
+            async with conn.execute(PROFILE_SQL, (user_id,)) as cursor:
+                row = await cursor.fetchone()
+        if not row:
+            return None
+        profile = dict(row)
+        profile_cache.put(user_id, profile, version)
+    
+    result = dict(profile)
+    # Get position on challenge mode leaderboard
+    if rank_index.ready:
+        result['leaderboard_rank'] = rank_index.rank(profile['total_wins'])
+    else:
+        # Index still warming up, count in SQL
+        async with get_db_connection(readonly=True) as conn:
+            async with conn.execute('''
+                SELECT COUNT(*) + 1 as rank
+                FROM stats
+                WHERE total_wins > ?
+            ''', (profile['total_wins'],)) as rank_cursor:
+                result['leaderboard_rank'] = (await rank_cursor.fetchone())['rank']
+    return result
+
+async def load_rank_index():
+    """Build the in-memory leaderboard rank index from the stats table."""
+    async with get_db_connection(readonly=True) as conn:
+        async with conn.execute('SELECT user_id, total_wins FROM stats WHERE total_wins > 0') as cursor:
+            rows = await cursor.fetchall()
+    rank_index.build((row['user_id'], row['total_wins']) for row in rows)
+    return len(rank_index)
 
 async def get_system_stats():
     """Get overall system statistics."""
-    async with get_db_connection() as conn:
+    async with get_db_connection(readonly=True) as conn:
         async with conn.execute('SELECT COUNT(*) as count FROM users') as cursor:
             users_count = (await cursor.fetchone())['count']
             
         async with conn.execute('SELECT COUNT(*) as count FROM groups') as cursor:
             groups_count = (await cursor.fetchone())['count']
             
-        async with conn.execute('SELECT COUNT(*) as count FROM game_history') as cursor:
-            games_count = (await cursor.fetchone())['count']
+        # Bot games may not have history rows (see BOT_GAME_STORAGE); bot_stats counts them all
+        async with conn.execute("SELECT COUNT(*) as count FROM game_history WHERE game_type = 'challenge'") as cursor:
+            challenge_games = (await cursor.fetchone())['count']
+            
+        async with conn.execute('SELECT COALESCE(SUM(total_games), 0) as count FROM bot_stats') as cursor:
+            bot_games = (await cursor.fetchone())['count']
+            
+        # Daily totals only exist for games kept with BOT_GAME_STORAGE=daily
+        async with conn.execute('''
+            SELECT COALESCE(SUM(games), 0) as games, COUNT(DISTINCT user_id) as players
+            FROM bot_daily_stats WHERE day > date('now', '-7 day')
+        ''') as cursor:
+            bot_week = await cursor.fetchone()
             
         seven_days_ago = (datetime.now() - timedelta(days=7)).isoformat()
         async with conn.execute('SELECT COUNT(*) as count FROM users WHERE last_active > ?', 
@@ -663,53 +757,24 @@ async def get_system_stats():
         return {
             'total_users': users_count,
             'total_groups': groups_count,
-            'total_games': games_count,
+            'total_games': challenge_games + bot_games,
+            'challenge_games': challenge_games,
+            'bot_games': bot_games,
+            'bot_games_7d': bot_week['games'],
+            'bot_players_7d': bot_week['players'],
             'active_users': active_users
         }
 
-async def get_user_bot_stats(user_id):
-    """Get bot game statistics for a user."""
-    async with get_db_connection() as conn:
-        async with conn.execute('''
-            SELECT total_games, total_wins, total_losses, total_ties,
-                   rock_played, paper_played, scissor_played
-            FROM bot_stats
-            WHERE user_id = ?
-        ''', (user_id,)) as cursor:
-            bot_stats = await cursor.fetchone()
-            
-            if not bot_stats:
-                return {
-                    'total_games': 0,
-                    'total_wins': 0,
-                    'total_losses': 0,
-                    'total_ties': 0,
-                    'rock_played': 0,
-                    'paper_played': 0,
-                    'scissor_played': 0
-                }
-            
-            return dict(bot_stats)
-
 async def get_broadcast_users():
     """Get list of all user IDs for broadcasting."""
-    async with get_db_connection() as conn:
+    async with get_db_connection(readonly=True) as conn:
         async with conn.execute('SELECT user_id FROM users') as cursor:
             users = await cursor.fetchall()
             return [user['user_id'] for user in users]
 
-async def add_achievement(user_id, achievement_type, description):
-    """Add a new achievement for a user."""
-    async with get_db_connection() as conn:
-        await conn.execute('''
-            INSERT INTO achievements (user_id, achievement_type, description)
-            VALUES (?, ?, ?)
-        ''', (user_id, achievement_type, description))
-        await conn.commit()
-
 async def get_user_achievements(user_id):
     """Get all achievements for a user."""
-    async with get_db_connection() as conn:
+    async with get_db_connection(readonly=True) as conn:
         async with conn.execute('''
             SELECT achievement_type, description, achievement_date
             FROM achievements
@@ -719,32 +784,238 @@ async def get_user_achievements(user_id):
             achievements = await cursor.fetchall()
             return [dict(achievement) for achievement in achievements]
 
-async def update_game_winner(game_id, winner_id):
-    """Update the game record with the winner."""
+async def _achievement_types(conn, user_id):
+    """Return the set of achievement types a user already holds."""
+    async with conn.execute(
+        'SELECT achievement_type FROM achievements WHERE user_id = ?', (user_id,)
+    ) as cursor:
+        return {row['achievement_type'] for row in await cursor.fetchall()}
+
+async def finalize_game(game_id, challenger_id, challenged_id, winner_id, rounds, round_rows,
+                        winner_score=0, loser_name=None):
+    """Record the outcome of a finished challenge game in a single transaction.
+
+    Writes the played rounds (``(round_number, challenger_move, challenged_move,
+    winner_id)`` rows), sets the winner, applies one stats delta per player with
+    the moves of all rounds, updates progress and unlocks achievements. Returns
+    the level changes per player and the unlocked achievements as
+    ``(user_id, achievement_type)`` pairs.
+    """
+    unlocked = []
+    levels = {}
+    new_stats = {}
+    new_group_stats = {}
+
+    async def unlock(conn, user_id, achievement_type, description, existing):
+        if achievement_type not in existing:
+            await conn.execute('''
+                INSERT INTO achievements (user_id, achievement_type, description)
+                VALUES (?, ?, ?)
+            ''', (user_id, achievement_type, description))
+            existing.add(achievement_type)
+            unlocked.append((user_id, achievement_type))
+
     async with get_db_connection() as conn:
-        await conn.execute('''
+        async with conn.execute('''
             UPDATE game_history SET winner_id = ? WHERE game_id = ?
-        ''', (winner_id, game_id))
+            RETURNING group_id
+        ''', (winner_id, game_id)) as cursor:
+            game_row = await cursor.fetchone()
+        group_id = game_row['group_id'] if game_row else None
+
+        await conn.executemany(ROUND_INSERT_SQL, [(game_id, *row) for row in round_rows])
+
+        moves = {
+            challenger_id: [row[1] for row in round_rows],
+            challenged_id: [row[2] for row in round_rows],
+        }
+
+        if winner_id is None:
+            results = {challenger_id: 'tie', challenged_id: 'tie'}
+        else:
+            loser_id = challenged_id if winner_id == challenger_id else challenger_id
+            results = {winner_id: 'win', loser_id: 'loss'}
+
+        for user_id, result in results.items():
+            # Move streaks follow the last move of each game
+            move = moves[user_id][-1] if moves[user_id] else None
+            stats_row = await _apply_challenge_stats(conn, user_id, result, _move_counts(moves[user_id]))
+            levels[user_id] = (stats_row['level_up'], stats_row['level'])
+            new_stats[user_id] = stats_row
+            progress = await _apply_user_progress(conn, user_id, result, move)
+            if group_id is not None:
+                new_group_stats[user_id] = await _apply_group_stats(conn, group_id, user_id, result)
+            existing = await _achievement_types(conn, user_id)
+
+            if result == 'win':
+                if stats_row['total_wins'] == 1:
+                    await unlock(conn, user_id, "first_win", "Won your first challenge game!", existing)
+                if rounds >= 3 and winner_score == rounds:
+                    await unlock(conn, user_id, "perfect_victory", f"Won all {rounds} rounds against {loser_name}", existing)
+                if progress['win_streak'] >= 3:
+                    await unlock(conn, user_id, "streak_winner", "Won 3 games in a row! You're on fire!", existing)
+
+            if progress['move_streak'] >= 10:
+                await unlock(conn, user_id, "move_master", "Mastered a move by playing it 10 times in a row!", existing)
+
+        await conn.commit()
+
+    profile_cache.invalidate(challenger_id, challenged_id)
+    for user_id, stats_row in new_stats.items():
+        rank_index.set_wins(user_id, stats_row['total_wins'])
+        leaderboard_cache.notify_stats(user_id, stats_row)
+    for user_id, group_row in new_group_stats.items():
+        leaderboard_cache.notify_group(group_id, user_id, group_row)
+
+    return {'levels': levels, 'achievements': unlocked}
+
+# How quick games against the bot are kept. bot_stats is always updated;
+# "history" also writes game_history/round_details rows, "daily" a per-user
+# row in bot_daily_stats, "log" a line in a size-capped rotating file and
+# "counters" nothing else.
+BOT_GAME_STORAGE_MODES = ('history', 'counters', 'daily', 'log')
+BOT_GAME_STORAGE = os.getenv("BOT_GAME_STORAGE", "history").lower()
+if BOT_GAME_STORAGE not in BOT_GAME_STORAGE_MODES:
+    raise ValueError(
+        f"BOT_GAME_STORAGE must be one of {', '.join(BOT_GAME_STORAGE_MODES)}, got {BOT_GAME_STORAGE!r}"
+    )
+BOT_GAME_LOG_PATH = Path(os.getenv("BOT_GAME_LOG_PATH", str(DB_DIR / "bot_games.log")))
+BOT_GAME_LOG_MAX_BYTES = int(os.getenv("BOT_GAME_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+BOT_GAME_LOG_BACKUPS = int(os.getenv("BOT_GAME_LOG_BACKUPS", "3"))
+
+BOT_DAILY_UPSERT_SQL = '''
+    INSERT INTO bot_daily_stats (user_id, day, games, wins, losses, ties)
+    VALUES (?, date('now'), 1, ?, ?, ?)
+    ON CONFLICT(user_id, day) DO UPDATE SET
+        games = games + 1,
+        wins = wins + excluded.wins,
+        losses = losses + excluded.losses,
+        ties = ties + excluded.ties
+'''
+
+_bot_game_log = None
+_bot_game_log_listener = None
+
+def _get_bot_game_log():
+    """Logger for one line per bot game in the rotating bot game log.
+
+    Records are queued and written by a listener thread, so the file write
+    and rotation stay off the event loop.
+    """
+    global _bot_game_log, _bot_game_log_listener
+    if _bot_game_log is None:
+        handler = logging.handlers.RotatingFileHandler(
+            BOT_GAME_LOG_PATH, maxBytes=BOT_GAME_LOG_MAX_BYTES, backupCount=BOT_GAME_LOG_BACKUPS
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s\t%(message)s"))
+        records = queue.SimpleQueue()
+        _bot_game_log_listener = logging.handlers.QueueListener(records, handler)
+        _bot_game_log_listener.start()
+        _bot_game_log = logging.getLogger("trihand.bot_games")
+        _bot_game_log.setLevel(logging.INFO)
+        _bot_game_log.propagate = False
+        _bot_game_log.addHandler(logging.handlers.QueueHandler(records))
+    return _bot_game_log
+
+def close_bot_game_log():
+    """Write out queued bot game log lines and close the log file (called on shutdown)."""
+    global _bot_game_log, _bot_game_log_listener
+    if _bot_game_log_listener is not None:
+        _bot_game_log_listener.stop()
+        for handler in _bot_game_log_listener.handlers:
+            handler.close()
+        for handler in list(_bot_game_log.handlers):
+            _bot_game_log.removeHandler(handler)
+        _bot_game_log = None
+        _bot_game_log_listener = None
+
+# Achievements a bot game can unlock, checked against the new bot_stats counters
+BOT_ACHIEVEMENTS = [
+    ("first_bot_game", "Played your first game against the bot!", lambda stats, result: stats['total_games'] == 1),
+    ("first_bot_win", "Won your first game against the bot!", lambda stats, result: result == 'win' and stats['total_wins'] == 1),
+]
+
+async def play_bot_game(user_id, bot_id, rounds, result):
+    """Record a finished game against the bot in a single transaction.
+
+    ``rounds`` holds ``(player_move, bot_move, round_result)`` per round and
+    ``result`` is the game result for the player. Bumps bot_stats, keeps the
+    game as configured by ``BOT_GAME_STORAGE`` and unlocks the
+    first-game/first-win achievements. Returns the game id (None unless
+    history rows are kept), the new counters and the unlocked achievement
+    types.
+    """
+    def winner_of(outcome):
+        return user_id if outcome == 'win' else bot_id if outcome == 'loss' else None
+
+    game_id = None
+    unlocked = []
+    async with get_db_connection() as conn:
+        if BOT_GAME_STORAGE == 'history':
+            cursor = await conn.execute('''
+                INSERT INTO game_history
+                (player1_id, player2_id, winner_id, game_type, rounds, group_id)
+                VALUES (?, ?, ?, 'bot', ?, NULL)
+            ''', (user_id, bot_id, winner_of(result), len(rounds)))
+            game_id = cursor.lastrowid
+            await conn.executemany(ROUND_INSERT_SQL, [
+                (game_id, number, player_move, bot_move, winner_of(outcome))
+                for number, (player_move, bot_move, outcome) in enumerate(rounds, 1)
+            ])
+        elif BOT_GAME_STORAGE == 'daily':
+            await conn.execute(BOT_DAILY_UPSERT_SQL, (
+                user_id, int(result == 'win'), int(result == 'loss'), int(result == 'tie')
+            ))
+        move_counts = _move_counts([player_move for player_move, _, _ in rounds])
+        stats = await _apply_bot_stats(conn, user_id, result, move_counts)
+        for achievement_type, description, earned in BOT_ACHIEVEMENTS:
+            if earned(stats, result):
+                await conn.execute('''
+                    INSERT INTO achievements (user_id, achievement_type, description)
+                    SELECT ?1, ?2, ?3
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM achievements WHERE user_id = ?1 AND achievement_type = ?2
+                    )
+                ''', (user_id, achievement_type, description))
+                unlocked.append(achievement_type)
         await conn.commit()
+    profile_cache.invalidate(user_id)
+    if BOT_GAME_STORAGE == 'log':
+        player_moves = ",".join(player_move for player_move, _, _ in rounds)
+        bot_moves = ",".join(bot_move for _, bot_move, _ in rounds)
+        _get_bot_game_log().info(f"{user_id}\t{player_moves}\t{bot_moves}\t{result}")
+    return {'game_id': game_id, 'stats': stats, 'achievements': unlocked}
+
+async def play_bot_round(user_id, bot_id, player_move, bot_move, result):
+    """Record a single-round quick game against the bot (see ``play_bot_game``)."""
+    return await play_bot_game(user_id, bot_id, [(player_move, bot_move, result)], result)
 
-async def get_last_moves(game_id):
-    """Retrieve the last moves for both players from round_details."""
+async def get_media_file_ids():
+    """Cached Telegram file_ids as ``{media_key: (url, file_id)}``."""
+    async with get_db_connection(readonly=True) as conn:
+        async with conn.execute('SELECT media_key, url, file_id FROM media_cache') as cursor:
+            return {row['media_key']: (row['url'], row['file_id']) for row in await cursor.fetchall()}
+
+async def save_media_file_id(media_key, url, file_id):
+    """Remember the file_id Telegram assigned to an uploaded image."""
     async with get_db_connection() as conn:
-        async with conn.execute('''
-            SELECT player1_move, player2_move
-            FROM round_details
-            WHERE game_id = ?
-            ORDER BY round_number DESC
-            LIMIT 1
-        ''', (game_id,)) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return row['player1_move'], row['player2_move']
-            return None, None
+        await conn.execute('''
+            INSERT INTO media_cache (media_key, url, file_id) VALUES (?, ?, ?)
+            ON CONFLICT(media_key) DO UPDATE SET
+                url = excluded.url,
+                file_id = excluded.file_id,
+                updated = CURRENT_TIMESTAMP
+        ''', (media_key, url, file_id))
+        await conn.commit()
+
+async def delete_media_file_id(media_key):
+    async with get_db_connection() as conn:
+        await conn.execute('DELETE FROM media_cache WHERE media_key = ?', (media_key,))
+        await conn.commit()
 
 async def list_users(raw=False):
     """List all users in the database."""
-    async with get_db_connection() as conn:
+    async with get_db_connection(readonly=True) as conn:
         async with conn.execute('SELECT user_id, first_name, last_name, username FROM users') as cursor:
             users = await cursor.fetchall()
             if raw:
@@ -753,7 +1024,7 @@ async def list_users(raw=False):
 
 async def list_groups(raw=False):
     """List all groups in the database."""
-    async with get_db_connection() as conn:
+    async with get_db_connection(readonly=True) as conn:
         async with conn.execute('SELECT group_id, title, username FROM groups') as cursor:
             groups = await cursor.fetchall()
             if raw:
@@ -762,29 +1033,31 @@ async def list_groups(raw=False):
 
 async def delete_user_data(user_id):
     """Delete all data for a specific user."""
+    discard_pending_activity(user_id=user_id)
+    rank_index.remove(user_id)
+    leaderboard_cache.clear()
+    profile_cache.invalidate(user_id)
+    move_models.discard(user_id)
     async with get_db_connection() as conn:
         await conn.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
         await conn.execute('DELETE FROM stats WHERE user_id = ?', (user_id,))
         await conn.execute('DELETE FROM bot_stats WHERE user_id = ?', (user_id,))
+        await conn.execute('DELETE FROM bot_daily_stats WHERE user_id = ?', (user_id,))
+        await conn.execute('DELETE FROM move_models WHERE user_id = ?', (user_id,))
         await conn.execute('DELETE FROM achievements WHERE user_id = ?', (user_id,))
         await conn.execute('DELETE FROM user_progress WHERE user_id = ?', (user_id,))
+        await conn.execute('DELETE FROM group_stats WHERE user_id = ?', (user_id,))
         await conn.execute('DELETE FROM game_history WHERE player1_id = ? OR player2_id = ?', (user_id, user_id))
         await conn.commit()
     return f"✅ User ID {user_id} deleted successfully."
 
 async def delete_group_data(group_id):
     """Delete all data for a specific group."""
+    discard_pending_activity(group_id=group_id)
+    leaderboard_cache.invalidate_group(group_id)
     async with get_db_connection() as conn:
         await conn.execute('DELETE FROM groups WHERE group_id = ?', (group_id,))
+        await conn.execute('DELETE FROM group_stats WHERE group_id = ?', (group_id,))
         await conn.execute('DELETE FROM game_history WHERE group_id = ?', (group_id,))
         await conn.commit()
     return f"✅ Group ID {group_id} deleted successfully."
-
-async def backup_database():
-    """Backup the database before migration."""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = f"trihand_backup_{timestamp}.db"
-    shutil.copy('trihand.db', backup_file)
-    print(f"Database backed up to {backup_file}")
-
-
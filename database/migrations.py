@@ -0,0 +1,289 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Only finished challenges count: a winner was set, or every round was played
+# (a tie). Rows of abandoned challenges are created at accept time and have
+# neither.
+GROUP_STATS_BACKFILL_SQL = '''
+    WITH finished AS (
+        SELECT g.group_id, g.player1_id, g.player2_id, g.winner_id, g.date_played
+        FROM game_history g
+        LEFT JOIN (
+            SELECT game_id, COUNT(*) AS played FROM round_details GROUP BY game_id
+        ) r ON r.game_id = g.game_id
+        WHERE g.game_type = 'challenge' AND g.group_id IS NOT NULL
+          AND (g.winner_id IS NOT NULL OR COALESCE(r.played, 0) >= g.rounds)
+    )
+    INSERT INTO group_stats (group_id, user_id, wins, losses, ties, games, last_played)
+    SELECT group_id, user_id,
+           SUM(CASE WHEN winner_id = user_id THEN 1 ELSE 0 END),
+           SUM(CASE WHEN winner_id != user_id THEN 1 ELSE 0 END),
+           SUM(CASE WHEN winner_id IS NULL THEN 1 ELSE 0 END),
+           COUNT(*),
+           MAX(date_played)
+    FROM (
+        SELECT group_id, player1_id AS user_id, winner_id, date_played FROM finished
+        UNION ALL
+        SELECT group_id, player2_id AS user_id, winner_id, date_played FROM finished
+        WHERE player2_id IS NOT NULL
+    )
+    GROUP BY group_id, user_id
+'''
+
+async def _create_base_schema(conn):
+    """Version 1: the original tables and indexes."""
+    # Users table
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        first_name TEXT NOT NULL,
+        last_name TEXT,
+        username TEXT,
+        joined_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        last_active TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # Groups table
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS groups (
+        group_id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        username TEXT,
+        joined_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        last_active TEXT DEFAULT CURRENT_TIMESTAMP,
+        member_count INTEGER DEFAULT 0
+    )
+    ''')
+
+    # Challenge stats table
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS stats (
+        user_id INTEGER PRIMARY KEY,
+        total_games INTEGER DEFAULT 0,
+        total_wins INTEGER DEFAULT 0,
+        total_losses INTEGER DEFAULT 0,
+        challenge_ties INTEGER DEFAULT 0,
+        challenge_games INTEGER DEFAULT 0,
+        challenge_wins INTEGER DEFAULT 0,
+        challenge_losses INTEGER DEFAULT 0,
+        rock_played INTEGER DEFAULT 0,
+        paper_played INTEGER DEFAULT 0,
+        scissor_played INTEGER DEFAULT 0,
+        experience_points INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+
+    # Bot stats table
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS bot_stats (
+        user_id INTEGER PRIMARY KEY,
+        total_games INTEGER DEFAULT 0,
+        total_wins INTEGER DEFAULT 0,
+        total_losses INTEGER DEFAULT 0,
+        total_ties INTEGER DEFAULT 0,
+        rock_played INTEGER DEFAULT 0,
+        paper_played INTEGER DEFAULT 0,
+        scissor_played INTEGER DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+
+    # Game history table
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS game_history (
+        game_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        player1_id INTEGER NOT NULL,
+        player2_id INTEGER,
+        winner_id INTEGER,
+        game_type TEXT CHECK(game_type IN ('challenge', 'bot')) NOT NULL,
+        rounds INTEGER DEFAULT 1,
+        date_played TEXT DEFAULT CURRENT_TIMESTAMP,
+        group_id INTEGER,
+        FOREIGN KEY (player1_id) REFERENCES users(user_id),
+        FOREIGN KEY (player2_id) REFERENCES users(user_id),
+        FOREIGN KEY (winner_id) REFERENCES users(user_id),
+        FOREIGN KEY (group_id) REFERENCES groups(group_id)
+    )
+    ''')
+
+    # Round details table
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS round_details (
+        round_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        game_id INTEGER NOT NULL,
+        round_number INTEGER NOT NULL,
+        player1_move TEXT CHECK(player1_move IN ('rock', 'paper', 'scissor')) NOT NULL,
+        player2_move TEXT CHECK(player2_move IN ('rock', 'paper', 'scissor')) NOT NULL,
+        winner_id INTEGER,
+        FOREIGN KEY (game_id) REFERENCES game_history(game_id),
+        FOREIGN KEY (winner_id) REFERENCES users(user_id)
+    )
+    ''')
+
+    # Achievements table
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS achievements (
+        achievement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        achievement_type TEXT CHECK(achievement_type IN (
+            'first_win', 'first_bot_game', 'first_bot_win', 'perfect_victory',
+            'veteran', 'comeback', 'lucky', 'streak_winner', 'move_master'
+        )) NOT NULL,
+        achievement_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        description TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+
+    # User progress table for achievement tracking
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_progress (
+        user_id INTEGER PRIMARY KEY,
+        win_streak INTEGER DEFAULT 0,
+        last_move TEXT CHECK(last_move IN ('rock', 'paper', 'scissor', '')) DEFAULT '',
+        move_streak INTEGER DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+
+    # Create indexes for performance
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_group ON game_history(group_id, game_type)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_players ON game_history(player1_id, player2_id)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_date ON game_history(date_played)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_stats_ranking ON stats(total_wins, level, experience_points)')
+
+async def _add_group_stats(conn):
+    """Version 2: per-group results, backfilled from challenge history."""
+    # Per-group challenge results for group leaderboards
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS group_stats (
+        group_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        wins INTEGER DEFAULT 0,
+        losses INTEGER DEFAULT 0,
+        ties INTEGER DEFAULT 0,
+        games INTEGER DEFAULT 0,
+        last_played TEXT DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (group_id, user_id),
+        FOREIGN KEY (group_id) REFERENCES groups(group_id),
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_group_stats_wins ON group_stats(group_id, wins DESC)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_group_stats_games ON group_stats(group_id, games DESC)')
+
+    # Databases created before versioning may already have live rows
+    async with conn.execute('SELECT 1 FROM group_stats LIMIT 1') as cursor:
+        if await cursor.fetchone() is None:
+            await conn.execute(GROUP_STATS_BACKFILL_SQL)
+
+async def _add_lookup_indexes(conn):
+    """Version 3: indexes for the filtered lookups that used to scan whole tables."""
+    # Rounds of one game (admin deletes)
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_round_details_game ON round_details(game_id, round_number)')
+    # /stats @username and the active-user count
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active)')
+    # player2_id / winner_id filters the (player1_id, player2_id) index can't serve
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_player2 ON game_history(player2_id)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_winner ON game_history(winner_id)')
+    # Per-user achievement lists and deletes
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_achievements_user ON achievements(user_id, achievement_date)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_group_stats_user ON group_stats(user_id)')
+    # Leaderboard categories not covered by idx_stats_ranking
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_stats_challenge_wins ON stats(challenge_wins)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_stats_games ON stats(total_games)')
+
+async def _add_bot_daily_stats(conn):
+    """Version 4: compact per-user daily bot game totals."""
+    # One row per user and day, used instead of per-game history when
+    # BOT_GAME_STORAGE=daily
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS bot_daily_stats (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        games INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        losses INTEGER DEFAULT 0,
+        ties INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, day),
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    ) WITHOUT ROWID
+    ''')
+
+async def _add_move_models(conn):
+    """Version 5: persisted smart-bot move models."""
+    # Serialized MoveModel counts (database/move_model.py), one per player
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS move_models (
+        user_id INTEGER PRIMARY KEY,
+        model BLOB NOT NULL,
+        updated TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+
+async def _add_media_cache(conn):
+    """Version 6: Telegram file_ids of images the bot sends."""
+    # Keyed by media name; file_id is only reused while url still matches
+    await conn.execute('''
+    CREATE TABLE IF NOT EXISTS media_cache (
+        media_key TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        updated TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+async def _add_ranking_indexes(conn):
+    """Version 7: indexes for the level leaderboard and per-type game counts."""
+    # Global level leaderboard (ORDER BY level, experience_points)
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_stats_level ON stats(level, experience_points)')
+    # Challenge game count in /gstats
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_game_history_type ON game_history(game_type)')
+
+async def _add_bot_daily_day_index(conn):
+    """Version 8: index for recent-day bot game totals."""
+    # Last-7-days totals in /gstats
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_bot_daily_stats_day ON bot_daily_stats(day)')
+
+# Ordered schema steps; each runs once and bumps PRAGMA user_version
+MIGRATIONS = [
+    (1, "base schema", _create_base_schema),
+    (2, "group_stats", _add_group_stats),
+    (3, "lookup indexes", _add_lookup_indexes),
+    (4, "bot_daily_stats", _add_bot_daily_stats),
+    (5, "move_models", _add_move_models),
+    (6, "media_cache", _add_media_cache),
+    (7, "ranking indexes", _add_ranking_indexes),
+    (8, "bot_daily_stats day index", _add_bot_daily_day_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+async def get_schema_version(conn):
+    async with conn.execute('PRAGMA user_version') as cursor:
+        return (await cursor.fetchone())[0]
+
+async def run_migrations(conn):
+    """Apply pending migrations in order, each in its own transaction."""
+    current = await get_schema_version(conn)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        await conn.execute('BEGIN IMMEDIATE')
+        try:
+            await step(conn)
+            await conn.execute(f'PRAGMA user_version = {version}')
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+        current = version
+    return current
@@ -0,0 +1,164 @@
+import os
+import random
+from array import array
+from collections import OrderedDict
+
+# Models kept in memory; evicted models are still written on the next flush
+MOVE_MODEL_CACHE_SIZE = int(os.getenv("MOVE_MODEL_CACHE_SIZE", "10000"))
+# Observations a context needs before it is trusted over a shorter one
+MOVE_MODEL_MIN_SAMPLES = int(os.getenv("MOVE_MODEL_MIN_SAMPLES", "2"))
+# A context's counts are halved when one reaches this, so old habits fade
+MOVE_MODEL_COUNT_CAP = 1024
+
+MOVES = ('rock', 'paper', 'scissor')
+MOVE_INDEX = {move: index for index, move in enumerate(MOVES)}
+# Move that beats each move
+COUNTER_MOVES = {'rock': 'paper', 'paper': 'scissor', 'scissor': 'rock'}
+
+# Layout of the count array: 3 order-0 counts, 3x3 order-1 counts
+# (previous move -> next move), 3x3x3 order-2 counts (two previous moves ->
+# next move), then the last two moves as index + 1 (0 = none yet).
+ORDER1_BASE = 3
+ORDER2_BASE = ORDER1_BASE + 9
+PREV2_SLOT = ORDER2_BASE + 27
+PREV1_SLOT = PREV2_SLOT + 1
+MODEL_SIZE = PREV1_SLOT + 1
+
+class MoveModel:
+    """Order-0/1/2 Markov counts of one player's moves in a fixed 82-byte array."""
+
+    __slots__ = ('counts',)
+
+    def __init__(self, counts=None):
+        self.counts = counts if counts is not None else array('H', bytes(MODEL_SIZE * 2))
+
+    @classmethod
+    def from_blob(cls, blob):
+        """Rebuild a model from ``to_blob`` output; unknown layouts start fresh."""
+        counts = array('H')
+        counts.frombytes(blob)
+        if len(counts) != MODEL_SIZE:
+            return cls()
+        return cls(counts)
+
+    def to_blob(self):
+        return self.counts.tobytes()
+
+    def _contexts(self):
+        """Base offsets of the contexts that apply now, longest first."""
+        prev2, prev1 = self.counts[PREV2_SLOT], self.counts[PREV1_SLOT]
+        if prev2 and prev1:
+            yield ORDER2_BASE + ((prev2 - 1) * 3 + prev1 - 1) * 3
+        if prev1:
+            yield ORDER1_BASE + (prev1 - 1) * 3
+        yield 0
+
+    def predict(self):
+        """Most likely next move of the player, or None without enough data."""
+        counts = self.counts
+        for base in self._contexts():
+            rock, paper, scissor = counts[base], counts[base + 1], counts[base + 2]
+            if rock + paper + scissor < MOVE_MODEL_MIN_SAMPLES:
+                continue
+            best = max(rock, paper, scissor)
+            return random.choice([move for move, count in zip(MOVES, (rock, paper, scissor)) if count == best])
+        return None
+
+    def counter(self):
+        """Move that beats the predicted one, or None without enough data."""
+        predicted = self.predict()
+        return COUNTER_MOVES[predicted] if predicted else None
+
+    def update(self, move):
+        """Count ``move`` in every context that applies and shift the history."""
+        counts = self.counts
+        index = MOVE_INDEX[move]
+        for base in self._contexts():
+            slot = base + index
+            if counts[slot] + 1 >= MOVE_MODEL_COUNT_CAP:
+                for offset in range(3):
+                    counts[base + offset] >>= 1
+            counts[slot] += 1
+        counts[PREV2_SLOT] = counts[PREV1_SLOT]
+        counts[PREV1_SLOT] = index + 1
+
+class MoveModelCache:
+    """LRU of per-user move models with lazy write-back.
+
+    Updated models are marked dirty and written in batches by the flush job;
+    a dirty model evicted before that keeps its blob until it is written.
+    """
+
+    def __init__(self, size=MOVE_MODEL_CACHE_SIZE):
+        self.size = size
+        self._models = OrderedDict()
+        self._dirty = set()
+        self._unsaved = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        model = self._models.get(user_id)
+        if model is None:
+            blob = self._unsaved.get(user_id)
+            if blob is None:
+                self.misses += 1
+                return None
+            model = self.put(user_id, MoveModel.from_blob(blob))
+        else:
+            self._models.move_to_end(user_id)
+        self.hits += 1
+        return model
+
+    def put(self, user_id, model):
+        self._models[user_id] = model
+        self._models.move_to_end(user_id)
+        while len(self._models) > self.size:
+            evicted_id, evicted = self._models.popitem(last=False)
+            if evicted_id in self._dirty:
+                self._dirty.discard(evicted_id)
+                self._unsaved[evicted_id] = evicted.to_blob()
+        return model
+
+    def observe(self, user_id, move):
+        """Update a cached model with the player's latest move."""
+        model = self._models.get(user_id)
+        if model is not None:
+            model.update(move)
+            self._dirty.add(user_id)
+
+    def take_dirty(self):
+        """``(user_id, blob)`` rows waiting to be written; clears the dirty set."""
+        rows = dict(self._unsaved)
+        rows.update((user_id, self._models[user_id].to_blob()) for user_id in self._dirty)
+        self._unsaved.clear()
+        self._dirty.clear()
+        return list(rows.items())
+
+    def requeue(self, rows):
+        """Put back rows whose write failed, unless the model changed since."""
+        for user_id, blob in rows:
+            if user_id not in self._dirty:
+                self._unsaved[user_id] = blob
+
+    def discard(self, user_id):
+        self._models.pop(user_id, None)
+        self._dirty.discard(user_id)
+        self._unsaved.pop(user_id, None)
+
+    def clear(self):
+        self._models.clear()
+        self._dirty.clear()
+        self._unsaved.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._models),
+            'dirty': len(self._dirty) + len(self._unsaved),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Shared model table for the smart bot
+move_models = MoveModelCache()
@@ -0,0 +1,88 @@
+class WinRankIndex:
+    """Order-statistic index over challenge win counts for O(log n) ranks.
+
+    A Fenwick tree counts players per win total. Players with zero wins are
+    never stored: they don't change anyone's rank and rank 1 + everyone
+    with at least one win.
+    """
+
+    def __init__(self, size=1024):
+        self._size = size
+        self._tree = [0] * (size + 1)
+        self._wins = {}
+        self._pending = {}
+        self.ready = False
+
+    def _add(self, wins, delta):
+        i = wins
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, wins):
+        """Number of players with between 1 and ``wins`` wins."""
+        total = 0
+        i = min(wins, self._size)
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _grow(self, wins):
+        size = self._size
+        while size < wins:
+            size *= 2
+        self._size = size
+        self._tree = [0] * (size + 1)
+        for value in self._wins.values():
+            self._add(value, 1)
+
+    def _set(self, user_id, wins):
+        old = self._wins.pop(user_id, 0)
+        if old:
+            self._add(old, -1)
+        if wins > 0:
+            if wins > self._size:
+                self._grow(wins)
+            self._wins[user_id] = wins
+            self._add(wins, 1)
+
+    def build(self, rows):
+        """Load ``(user_id, total_wins)`` rows and start serving ranks."""
+        self._wins.clear()
+        self._tree = [0] * (self._size + 1)
+        for user_id, wins in rows:
+            self._set(user_id, wins or 0)
+        # Apply changes that arrived while the snapshot was being read
+        for user_id, wins in self._pending.items():
+            self._set(user_id, wins)
+        self._pending.clear()
+        self.ready = True
+
+    def set_wins(self, user_id, wins):
+        """Record a player's new win total."""
+        if not self.ready:
+            self._pending[user_id] = wins
+            return
+        self._set(user_id, wins)
+
+    def remove(self, user_id):
+        """Forget a deleted player."""
+        self.set_wins(user_id, 0)
+
+    def reset(self):
+        """Drop everything (after a full data wipe)."""
+        self._wins.clear()
+        self._pending.clear()
+        self._tree = [0] * (self._size + 1)
+
+    def rank(self, wins):
+        """Leaderboard position for a player with ``wins`` wins."""
+        return 1 + len(self._wins) - self._prefix(wins or 0)
+
+    def __len__(self):
+        return len(self._wins)
+
+
+# Shared index used by the stats helpers
+rank_index = WinRankIndex()
@@ -2,19 +2,22 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, User
 from telegram.ext import ContextTypes, CallbackQueryHandler
 from telegram.constants import ParseMode
 from database.connection import (
-    get_db_connection, 
     update_user_activity, 
     update_group_activity, 
-    update_stats, 
     record_game, 
-    record_round,
-    add_achievement,
-    update_game_winner,
-    get_last_moves
+    finalize_game
 )
+from handlers.outbound import outbound
+from handlers.game_state import ChallengeRegistry, ChallengeState, TimerQueue, BOTH_PLAYERS
 from datetime import datetime, timedelta
+import os
 import random
 import asyncio
+import logging
+import weakref
+from functools import partial
+
+logger = logging.getLogger(__name__)
 
 # Game configuration
 GAME_CHOICES = {
@@ -27,7 +30,38 @@ CHOICE_EMOJIS = {
     "paper": "📄", 
     "scissor": "✂️"
 }
-ongoing_challenges = {}
+# Notification title and icon per achievement type
+ACHIEVEMENT_TITLES = {
+    "first_win": ("First Win", "🎉"),
+    "perfect_victory": ("Perfect Victory", "🌟"),
+    "streak_winner": ("Streak Winner", "🔥"),
+    "move_master": ("Move Master", "🎯")
+}
+# Seconds a round result stays on screen before the game moves on
+ROUND_RESULT_DELAY = 2
+# Timer settings, in seconds
+CHALLENGE_EXPIRY = int(os.getenv("CHALLENGE_EXPIRY", "300"))  # unanswered challenges
+TURN_TIMEOUT = int(os.getenv("TURN_TIMEOUT", "120"))  # AFK player forfeits the game
+TIMER_TICK = float(os.getenv("TIMER_TICK", "1"))
+ongoing_challenges = ChallengeRegistry()
+# Expiry and turn timers for ongoing challenges, keyed by challenge id
+challenge_timers = TimerQueue()
+reaped_challenges = {'expired': 0, 'forfeited': 0}
+# Per-chat locks for creating challenges; entries disappear once unused
+_chat_locks = weakref.WeakValueDictionary()
+
+def chat_lock(chat_id):
+    """Lock serialising challenge creation within one chat."""
+    lock = _chat_locks.get(chat_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _chat_locks[chat_id] = lock
+    return lock
+
+async def run_deferred(calls):
+    """Make the Telegram calls a handler put off until it released the challenge lock."""
+    for call in calls:
+        await call()
 
 # Function to clear ongoing challenges
 async def clear_ongoing_challenges():
@@ -35,8 +69,17 @@ async def clear_ongoing_challenges():
     global ongoing_challenges
     old_count = len(ongoing_challenges)
     ongoing_challenges.clear()
+    challenge_timers.clear()
     return old_count
 
+async def clear_user_challenges_in_group(user_id, chat_id):
+    """Remove every challenge the user takes part in within one chat."""
+    challenge_ids = ongoing_challenges.for_player_in_chat(user_id, chat_id)
+    for challenge_id in challenge_ids:
+        ongoing_challenges.pop(challenge_id)
+        challenge_timers.cancel(challenge_id)
+    return len(challenge_ids)
+
 async def clear_challenges_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     chat_id = update.message.chat_id
@@ -80,14 +123,16 @@ async def challenge(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Update the challenged user's info in DB
     await update_user_activity(challenged.id, challenged.first_name, challenged.last_name, challenged.username)
 
-    # Validate the number of rounds
-    try:
-        rounds = int(context.args[0]) if context.args else 1
-        if not 1 <= rounds <= 10:
-            await update.message.reply_text("⚠️ Number of rounds must be between 1-10.")
-            return
-    except (IndexError, ValueError):
-        rounds = 1  # Default to 1 round if not specified
+    # Rounds and "fast" may come in either order (/challenge 5 fast, /challenge fast 5)
+    args = context.args or []
+    numbers = [arg for arg in args if arg.lstrip("-").isdigit()]
+    rounds = int(numbers[0]) if numbers else 1  # Default to 1 round if not specified
+    if not 1 <= rounds <= 10:
+        await update.message.reply_text("⚠️ Number of rounds must be between 1-10.")
+        return
+
+    # "fast" lets both players pick at the same time
+    mode = "fast" if any(arg.lower() == "fast" for arg in args) else "classic"
 
     # Check for existing challenge
     existing_challenge_id = f"{challenger.id}_{challenged.id}"
@@ -97,24 +142,20 @@ async def challenge(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Create challenge data
     challenge_id = f"{challenger.id}_{challenged.id}"
-    ongoing_challenges[challenge_id] = {
-        "challenger": challenger,
-        "challenged": challenged,
-        "rounds": rounds,
-        "current_round": 1,
-        "challenger_score": 0,
-        "challenged_score": 0,
-        "status": "pending",
-        "chat_id": update.message.chat_id,
-        "moves": {
-            "challenger": [],
-            "challenged": []
-        },
-        "timestamp": asyncio.get_event_loop().time(),  # For challenge expiry
-        "game_id": None  # Will be set when game starts
-    }
+    state = ChallengeState(
+        challenger_id=challenger.id,
+        challenged_id=challenged.id,
+        challenger_name=challenger.first_name,
+        challenged_name=challenged.first_name,
+        chat_id=update.message.chat_id,
+        rounds=rounds,
+        mode=mode,
+        timestamp=asyncio.get_event_loop().time()  # For challenge expiry
+    )
+    ongoing_challenges[challenge_id] = state
 
     # Send challenge message with Accept/Decline buttons
+    mode_line = "⚡ Fast mode: both players pick at the same time.\n" if mode == "fast" else ""
     keyboard = [
         [
             InlineKeyboardButton("✅ Accept", callback_data=f"accept_{challenge_id}"),
@@ -125,37 +166,73 @@ async def challenge(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         f"🎮 <b>Game Challenge!</b> 🎮\n\n"
         f"{challenged.first_name}, you've been challenged by {challenger.first_name} "
-        f"to a {'multi-round ' if rounds > 1 else ''}game of Rock Paper Scissors!\n\n"
-        f"<i>This challenge will expire in 5 minutes</i>",
+        f"to a {'multi-round ' if rounds > 1 else ''}game of Rock Paper Scissors!\n"
+        f"{mode_line}\n"
+        f"<i>This challenge will expire in {CHALLENGE_EXPIRY // 60} minutes</i>",
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode=ParseMode.HTML
     )
     
     # Schedule challenge expiry
-    context.job_queue.run_once(
-        challenge_expiry, 
-        300,  # 5 minutes
-        data={"challenge_id": challenge_id, "chat_id": update.message.chat_id}
-    )
+    challenge_timers.schedule(challenge_id, CHALLENGE_EXPIRY, "expiry", state)
+
+async def challenge_timer_job(context: ContextTypes.DEFAULT_TYPE):
+    """Reap unanswered challenges and games whose current player went AFK."""
+    for challenge_id, kind, state in challenge_timers.pop_due():
+        # Ignore timers of games that have since ended or been replaced
+        if ongoing_challenges.get(challenge_id) is not state:
+            continue
+        try:
+            if kind == "expiry":
+                await challenge_expiry(context, challenge_id, state)
+            elif kind == "turn":
+                await turn_timeout(context, challenge_id, state)
+        except Exception as e:
+            logger.error(f"Error handling {kind} timer for challenge {challenge_id}: {e}")
 
-async def challenge_expiry(context: ContextTypes.DEFAULT_TYPE):
+async def challenge_expiry(context, challenge_id, state):
     """Handle expiration of challenges that weren't accepted."""
-    job_data = context.job.data
-    challenge_id = job_data["challenge_id"]
-    chat_id = job_data["chat_id"]
-    
-    if challenge_id in ongoing_challenges and ongoing_challenges[challenge_id]["status"] == "pending":
-        challenger = ongoing_challenges[challenge_id]["challenger"]
-        challenged = ongoing_challenges[challenge_id]["challenged"]
+    async with state.lock:
+        if ongoing_challenges.get(challenge_id) is not state or state.status != "pending":
+            return
         
         # Remove the challenge
         del ongoing_challenges[challenge_id]
-        
-        # Notify about expiration
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"⏰ The challenge from {challenger.first_name} to {challenged.first_name} has expired."
-        )
+        reaped_challenges['expired'] += 1
+    
+    # Notify about expiration
+    await outbound.send_message(
+        context.bot,
+        chat_id=state.chat_id,
+        text=f"⏰ The challenge from {state.challenger_name} to {state.challenged_name} has expired."
+    )
+
+async def turn_timeout(context, challenge_id, state):
+    """End a game whose current player didn't move in time; they forfeit."""
+    async with state.lock:
+        if ongoing_challenges.get(challenge_id) is not state or state.status != "active":
+            return
+        # No turn is running while a round result is shown
+        if state.current_player is None:
+            return
+        if state.current_player == BOTH_PLAYERS:
+            # Whoever hasn't picked forfeits; if neither did, the score decides
+            missing = [pid for pid in (state.challenger_id, state.challenged_id) if not state.has_moved(pid)]
+            forfeit_id = missing[0] if len(missing) == 1 else None
+        else:
+            forfeit_id = state.current_player
+        reaped_challenges['forfeited'] += 1
+        close_game(state)
+    await end_game(context, state, forfeit_id=forfeit_id)
+
+def challenge_timer_stats():
+    """Live timer count and number of reaped challenges, for /gstats."""
+    return {
+        'ongoing': len(ongoing_challenges),
+        'timers': len(challenge_timers),
+        'expired': reaped_challenges['expired'],
+        'forfeited': reaped_challenges['forfeited'],
+    }
 
 # Callback handler for Accept/Decline buttons
 async def challenge_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -175,78 +252,117 @@ async def challenge_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     # Check if the user responding is the challenged person
-    if user.id != challenge_data["challenged"].id:
+    if user.id != challenge_data.challenged_id:
         await query.answer("This challenge is not for you!", show_alert=True)
         return
 
-    challenger = challenge_data["challenger"]
-    challenged = challenge_data["challenged"]
-
-    if action == "decline":
-        await query.edit_message_text(
-            f"❌ {challenged.first_name} declined the challenge from {challenger.first_name}."
-        )
-        del ongoing_challenges[challenge_id]
-        return
+    after = []
+    async with challenge_data.lock:
+        # Only the first accept/decline tap counts
+        if ongoing_challenges.get(challenge_id) is not challenge_data or challenge_data.status != "pending":
+            return
+        
+        if action == "decline":
+            await outbound.edit_message_text(
+                context.bot, query.message.chat_id, query.message.message_id,
+                f"❌ {challenge_data.challenged_name} declined the challenge from {challenge_data.challenger_name}."
+            )
+            del ongoing_challenges[challenge_id]
+            challenge_timers.cancel(challenge_id)
+            return
     
-    elif action == "accept":
-        # Challenge accepted - start the game
-        challenge_data["status"] = "active"
+        elif action == "accept":
+            # Challenge accepted - start the game
+            challenge_data.status = "active"
         
-        # Create the game in the database and get game_id
-        game_id = await record_game(
-            challenger.id, 
-            challenged.id, 
-            None,  # winner_id will be set when game ends
-            "challenge", 
-            challenge_data["rounds"],
-            query.message.chat.id
-        )
-        challenge_data["game_id"] = game_id
+            # Create the game in the database and get game_id
+            game_id = await record_game(
+                challenge_data.challenger_id, 
+                challenge_data.challenged_id, 
+                None,  # winner_id will be set when game ends
+                "challenge", 
+                challenge_data.rounds,
+                query.message.chat.id
+            )
+            challenge_data.game_id = game_id
         
-        await start_challenge(query, challenge_data)
+            await start_challenge(query, challenge_id, challenge_data, after)
+    await run_deferred(after)
 
 # Start the challenge
-async def start_challenge(query, challenge_data):
-    challenger = challenge_data["challenger"]
-    challenged = challenge_data["challenged"]
-    rounds = challenge_data["rounds"]
+async def start_challenge(query, challenge_id, challenge_data, after):
+    """Open round one; the move buttons are sent through ``after`` once the lock is released."""
+    challenger_name = challenge_data.challenger_name
+    challenged_name = challenge_data.challenged_name
+    rounds = challenge_data.rounds
 
     # Create a nicely formatted message with emojis and formatting
-    message = await query.edit_message_text(
+    await outbound.edit_message_text(
+        query.get_bot(), query.message.chat_id, query.message.message_id,
         f"🎮 <b>Game On!</b> 🎮\n\n"
-        f"<b>{challenger.first_name}</b> vs <b>{challenged.first_name}</b>\n"
+        f"<b>{challenger_name}</b> vs <b>{challenged_name}</b>\n"
         f"{'🏆 Best of ' + str(rounds) + ' rounds! 🏆' if rounds > 1 else '🏆 Single round battle! 🏆'}\n\n"
-        f"<b>Round {challenge_data['current_round']}/{rounds}</b>\n\n"
+        f"<b>Round {challenge_data.current_round}/{rounds}</b>\n\n"
         f"<b>Score:</b>\n"
-        f"{challenger.first_name}: {challenge_data['challenger_score']}\n"
-        f"{challenged.first_name}: {challenge_data['challenged_score']}\n\n"
-        f"<i>{challenger.first_name}, it's your turn to choose!</i>",
+        f"{challenger_name}: {challenge_data.challenger_score}\n"
+        f"{challenged_name}: {challenge_data.challenged_score}\n\n"
+        f"{turn_prompt(challenge_data, 'to choose')}",
+        reply_markup=fast_move_keyboard() if challenge_data.mode == "fast" else None,
         parse_mode=ParseMode.HTML
     )
 
-    challenge_data["message_id"] = message.message_id
-    challenge_data["current_player"] = challenger.id
-
-    await send_move_buttons(query.message.chat.id, challenger)
+    challenge_data.message_id = query.message.message_id
+    ongoing_challenges.bind_message(challenge_id, query.message.chat_id, query.message.message_id)
+    challenge_timers.schedule(challenge_id, TURN_TIMEOUT, "turn", challenge_data)
+    if challenge_data.mode == "fast":
+        # Both players pick on the status message itself
+        challenge_data.current_player = BOTH_PLAYERS
+        return
+    challenge_data.current_player = challenge_data.challenger_id
+
+    after.append(partial(
+        send_move_buttons, query.get_bot(), challenge_id, query.message.chat.id,
+        challenge_data.challenger_id, challenger_name
+    ))
+
+def turn_prompt(challenge_data, action="now"):
+    """Closing line of the status message telling who should pick."""
+    if challenge_data.mode == "fast":
+        return "<i>Both players, pick your move! Choices stay hidden until both have picked.</i>"
+    if action == "now":
+        return f"<i>{challenge_data.challenger_name}, it's your turn now!</i>"
+    return f"<i>{challenge_data.challenger_name}, it's your turn {action}!</i>"
+
+def fast_move_keyboard():
+    """Shared move buttons for fast mode; the tapping user identifies the player."""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("🪨 Rock", callback_data="fmove_rock"),
+            InlineKeyboardButton("📄 Paper", callback_data="fmove_paper"),
+            InlineKeyboardButton("✂️ Scissor", callback_data="fmove_scissor")
+        ]
+    ])
 
 # Send move buttons in a separate message
-async def send_move_buttons(chat_id, player):
+async def send_move_buttons(bot, challenge_id, chat_id, player_id, player_name):
     keyboard = [
         [
-            InlineKeyboardButton("🪨 Rock", callback_data=f"move_rock_{player.id}"),
-            InlineKeyboardButton("📄 Paper", callback_data=f"move_paper_{player.id}"),
-            InlineKeyboardButton("✂️ Scissor", callback_data=f"move_scissor_{player.id}")
+            InlineKeyboardButton("🪨 Rock", callback_data=f"move_rock_{player_id}"),
+            InlineKeyboardButton("📄 Paper", callback_data=f"move_paper_{player_id}"),
+            InlineKeyboardButton("✂️ Scissor", callback_data=f"move_scissor_{player_id}")
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await player.get_bot().send_message(
+    message = await outbound.send_message(
+        bot,
         chat_id=chat_id,
-        text=f"🎲 <b>{player.first_name}</b>, make your move!\n<i>(Only you can see this message)</i>",
+        text=f"🎲 <b>{player_name}</b>, make your move!\n<i>(Only you can see this message)</i>",
         reply_markup=reply_markup,
         parse_mode=ParseMode.HTML
     )
+    # Index the buttons so the move can be matched to its game directly
+    ongoing_challenges.bind_message(challenge_id, chat_id, message.message_id)
 
 # Determine winner function with more detailed response
 def determine_winner(player1_choice, player2_choice):
@@ -283,302 +399,328 @@ async def move_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await query.answer()
 
-    # Find the challenge this user is part of
-    challenge_id = None
-    for cid, data in ongoing_challenges.items():
-        if data["status"] == "active" and data["current_player"] == user_id:
-            challenge_id = cid
-            break
+    # Find the challenge these move buttons belong to
+    chat_id = query.message.chat_id
+    challenge_id = ongoing_challenges.by_message(chat_id, query.message.message_id)
+    if challenge_id is None:
+        # Fall back to the player's games in this chat
+        for cid in ongoing_challenges.for_player_in_chat(user_id, chat_id):
+            state = ongoing_challenges[cid]
+            if state.status == "active" and state.current_player == user_id:
+                challenge_id = cid
+                break
     
-    if not challenge_id:
+    challenge_data = ongoing_challenges.get(challenge_id)
+    if not challenge_data or challenge_data.status != "active" or challenge_data.current_player != user_id:
         await query.edit_message_text("This game is no longer active.")
         return
 
-    challenge_data = ongoing_challenges[challenge_id]
-    challenger = challenge_data["challenger"]
-    challenged = challenge_data["challenged"]
+    after = []
+    async with challenge_data.lock:
+        # Re-check under the lock: a concurrent tap may have advanced the game
+        if ongoing_challenges.get(challenge_id) is not challenge_data or challenge_data.current_player != user_id:
+            return
+        await play_move(context, query, challenge_id, challenge_data, user_id, user_choice, after)
+    await run_deferred(after)
+
+async def play_move(context, query, challenge_id, challenge_data, user_id, user_choice, after):
+    """Apply one player's move; the caller holds the challenge lock and runs ``after``."""
+    chat_id = query.message.chat_id
+    challenger_id = challenge_data.challenger_id
+    challenged_id = challenge_data.challenged_id
+    challenger_name = challenge_data.challenger_name
+    challenged_name = challenge_data.challenged_name
     
     # Store the user's move
-    if user.id == challenger.id:
-        challenge_data["challenger_move"] = user_choice
-        challenge_data["moves"]["challenger"].append(user_choice)
-        challenge_data["current_player"] = challenged.id
+    challenge_data.set_move(user_id, user_choice)
+    if user_id == challenger_id:
+        challenge_data.current_player = challenged_id
+        challenge_timers.schedule(challenge_id, TURN_TIMEOUT, "turn", challenge_data)
         
         # Delete the move selection message
-        await query.delete_message()
+        ongoing_challenges.unbind_message(chat_id, query.message.message_id)
+        after.append(partial(outbound.delete_message, context.bot, chat_id, query.message.message_id))
         
         # Update the game status message
-        await context.bot.edit_message_text(
-            chat_id=challenge_data["chat_id"],
-            message_id=challenge_data["message_id"],
+        await outbound.edit_message_text(
+            context.bot,
+            chat_id=challenge_data.chat_id,
+            message_id=challenge_data.message_id,
             text=f"🎮 <b>Game In Progress</b> 🎮\n\n"
-                f"<b>{challenger.first_name}</b> vs <b>{challenged.first_name}</b>\n"
-                f"<b>Round {challenge_data['current_round']}/{challenge_data['rounds']}</b>\n\n"
+                f"<b>{challenger_name}</b> vs <b>{challenged_name}</b>\n"
+                f"<b>Round {challenge_data.current_round}/{challenge_data.rounds}</b>\n\n"
                 f"<b>Score:</b>\n"
-                f"{challenger.first_name}: {challenge_data['challenger_score']}\n"
-                f"{challenged.first_name}: {challenge_data['challenged_score']}\n\n"
-                f"✅ {challenger.first_name} has made their move!\n"
-                f"<i>{challenged.first_name}, it's your turn now!</i>",
+                f"{challenger_name}: {challenge_data.challenger_score}\n"
+                f"{challenged_name}: {challenge_data.challenged_score}\n\n"
+                f"✅ {challenger_name} has made their move!\n"
+                f"<i>{challenged_name}, it's your turn now!</i>",
             parse_mode=ParseMode.HTML
         )
         
         # Send move buttons to the challenged player
-        await send_move_buttons(challenge_data["chat_id"], challenged)
-        
-    elif user.id == challenged.id:
-        challenge_data["challenged_move"] = user_choice
-        challenge_data["moves"]["challenged"].append(user_choice)
+        after.append(partial(
+            send_move_buttons, context.bot, challenge_id, challenge_data.chat_id, challenged_id, challenged_name
+        ))
         
+    elif user_id == challenged_id:
         # Delete the move selection message
-        await query.delete_message()
-        
-        # Process round results
-        challenger_move = challenge_data["challenger_move"]
-        challenged_move = user_choice
-        
-        # Determine winner and explanation
-        result, explanation = determine_winner(challenger_move, challenged_move)
-        
-        # Record the round in the database
-        if result == "challenger":
-            winner_id = challenger.id
-            challenge_data["challenger_score"] += 1
-        elif result == "challenged":
-            winner_id = challenged.id
-            challenge_data["challenged_score"] += 1
-        else:  # tie
-            winner_id = None
+        ongoing_challenges.unbind_message(chat_id, query.message.message_id)
+        after.append(partial(outbound.delete_message, context.bot, chat_id, query.message.message_id))
         
-        # Record round in database
-        await record_round(
-            challenge_data["game_id"],
-            challenge_data["current_round"],
-            challenger_move,
-            challenged_move,
-            winner_id
-        )
-        
-        # Update player stats with their move choices
-        await update_stats(challenger.id, "challenge", "played", challenger_move)
-        await update_stats(challenged.id, "challenge", "played", challenged_move)
-        
-        # Format emoji for moves
-        challenger_emoji = CHOICE_EMOJIS[challenger_move]
-        challenged_emoji = CHOICE_EMOJIS[challenged_move]
-        
-        # Update round result message
-        round_result_text = (
-            f"🎮 <b>Round {challenge_data['current_round']} Result</b> 🎮\n\n"
-            f"<b>{challenger.first_name}</b> chose {challenger_emoji} {challenger_move.capitalize()}\n"
-            f"<b>{challenged.first_name}</b> chose {challenged_emoji} {challenged_move.capitalize()}\n\n"
-            f"{explanation}\n\n"
-        )
-        
-        if result == "challenger":
-            round_result_text += f"🏅 <b>{challenger.first_name} wins this round!</b> 🏅"
-        elif result == "challenged":
-            round_result_text += f"🏅 <b>{challenged.first_name} wins this round!</b> 🏅"
+        await resolve_round(context, challenge_id, challenge_data)
+
+async def fast_move_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle a pick on the shared fast-mode keyboard."""
+    query = update.callback_query
+    user = query.from_user
+    user_choice = query.data.split("_", 1)[1]
+    
+    challenge_id = ongoing_challenges.by_message(query.message.chat_id, query.message.message_id)
+    challenge_data = ongoing_challenges.get(challenge_id)
+    if not challenge_data:
+        await query.answer("This game is no longer active.", show_alert=True)
+        return
+    if user.id not in (challenge_data.challenger_id, challenge_data.challenged_id):
+        await query.answer("This game is not yours!", show_alert=True)
+        return
+    
+    async with challenge_data.lock:
+        if ongoing_challenges.get(challenge_id) is not challenge_data or challenge_data.current_player != BOTH_PLAYERS:
+            answer = "Wait for the next round!"
+        elif challenge_data.has_moved(user.id):
+            answer = "You already picked this round!"
         else:
-            round_result_text += "🤝 <b>This round is a tie!</b> 🤝"
-        
-        await context.bot.edit_message_text(
-            chat_id=challenge_data["chat_id"],
-            message_id=challenge_data["message_id"],
-            text=round_result_text,
+            answer = f"You picked {GAME_CHOICES[user_choice]}"
+            await record_fast_move(context, query, challenge_id, challenge_data, user.id, user_choice)
+    await query.answer(answer)
+
+async def record_fast_move(context, query, challenge_id, challenge_data, user_id, user_choice):
+    """Store a fast-mode pick and resolve the round once both are in; the caller holds the lock."""
+    challenge_data.set_move(user_id, user_choice)
+    
+    if not challenge_data.has_moved(challenge_data.challenger_id) or not challenge_data.has_moved(challenge_data.challenged_id):
+        # Show that one pick is in without revealing it
+        await outbound.edit_message_text(
+            context.bot, query.message.chat_id, query.message.message_id,
+            f"🎮 <b>Game In Progress</b> ⚡\n\n"
+            f"<b>{challenge_data.challenger_name}</b> vs <b>{challenge_data.challenged_name}</b>\n"
+            f"<b>Round {challenge_data.current_round}/{challenge_data.rounds}</b>\n\n"
+            f"<b>Score:</b>\n"
+            f"{challenge_data.challenger_name}: {challenge_data.challenger_score}\n"
+            f"{challenge_data.challenged_name}: {challenge_data.challenged_score}\n\n"
+            f"✅ {challenge_data.name_of(user_id)} has picked!\n"
+            f"<i>Waiting for the other player...</i>",
+            reply_markup=fast_move_keyboard(),
             parse_mode=ParseMode.HTML
         )
-        
-        # Check if game is over
-        if challenge_data["current_round"] == challenge_data["rounds"]:
-            # Wait 2 seconds before showing final result
-            await asyncio.sleep(2)
-            await end_game(context, challenge_data)
-            return
-        
-        # Prepare for next round
-        challenge_data["current_round"] += 1
-        challenge_data["current_player"] = challenger.id
-        del challenge_data["challenger_move"]
-        del challenge_data["challenged_move"]
-        
-        # Wait 2 seconds before starting next round
-        await asyncio.sleep(2)
-        
-        # Update message for next round
-        await context.bot.edit_message_text(
-            chat_id=challenge_data["chat_id"],
-            message_id=challenge_data["message_id"],
-            text=f"🎮 <b>Game Continues</b> 🎮\n\n"
-                f"<b>{challenger.first_name}</b> vs <b>{challenged.first_name}</b>\n"
-                f"<b>Round {challenge_data['current_round']}/{challenge_data['rounds']}</b>\n\n"
-                f"<b>Score:</b>\n"
-                f"{challenger.first_name}: {challenge_data['challenger_score']}\n"
-                f"{challenged.first_name}: {challenge_data['challenged_score']}\n\n"
-                f"<i>{challenger.first_name}, it's your turn now!</i>",
-            parse_mode=ParseMode.HTML
-        )
-        
-        # Send move buttons to challenger
-        await send_move_buttons(challenge_data["chat_id"], challenger)
+        return
+    
+    await resolve_round(context, challenge_id, challenge_data)
+
+async def resolve_round(context, challenge_id, challenge_data):
+    """Score a round once both picks are in; the caller holds the challenge lock."""
+    challenger_id = challenge_data.challenger_id
+    challenged_id = challenge_data.challenged_id
+    challenger_name = challenge_data.challenger_name
+    challenged_name = challenge_data.challenged_name
+    
+    # Process round results
+    challenger_move, challenged_move = challenge_data.pending_moves()
+    challenge_data.close_round()
+    
+    # Determine winner and explanation
+    result, explanation = determine_winner(challenger_move, challenged_move)
+    
+    # Rounds and move counts are written once, when the game ends
+    if result == "challenger":
+        challenge_data.challenger_score += 1
+    elif result == "challenged":
+        challenge_data.challenged_score += 1
+    
+    # Format emoji for moves
+    challenger_emoji = CHOICE_EMOJIS[challenger_move]
+    challenged_emoji = CHOICE_EMOJIS[challenged_move]
+    
+    # Update round result message
+    round_result_text = (
+        f"🎮 <b>Round {challenge_data.current_round} Result</b> 🎮\n\n"
+        f"<b>{challenger_name}</b> chose {challenger_emoji} {challenger_move.capitalize()}\n"
+        f"<b>{challenged_name}</b> chose {challenged_emoji} {challenged_move.capitalize()}\n\n"
+        f"{explanation}\n\n"
+    )
+    
+    if result == "challenger":
+        round_result_text += f"🏅 <b>{challenger_name} wins this round!</b> 🏅"
+    elif result == "challenged":
+        round_result_text += f"🏅 <b>{challenged_name} wins this round!</b> 🏅"
+    else:
+        round_result_text += "🤝 <b>This round is a tie!</b> 🤝"
+    
+    await outbound.edit_message_text(
+        context.bot,
+        chat_id=challenge_data.chat_id,
+        message_id=challenge_data.message_id,
+        text=round_result_text,
+        parse_mode=ParseMode.HTML,
+        coalesce=False  # the next round's edit must not replace the result
+    )
+    
+    # Nobody can move while the round result is shown
+    challenge_data.current_player = None
+    challenge_timers.cancel(challenge_id)
+    
+    # Show the final result or start the next round after a short pause
+    context.job_queue.run_once(
+        round_transition,
+        ROUND_RESULT_DELAY,
+        data={"challenge_id": challenge_id, "game_id": challenge_data.game_id}
+    )
 
-async def end_game(context, challenge_data):
-    """End the game and display final results."""
-    challenger = challenge_data["challenger"]
-    challenged = challenge_data["challenged"]
-    challenger_score = challenge_data["challenger_score"]
-    challenged_score = challenge_data["challenged_score"]
-    game_id = challenge_data["game_id"]
+async def round_transition(context: ContextTypes.DEFAULT_TYPE):
+    """Finish the game or open the next round once the round result has been shown."""
+    job_data = context.job.data
+    challenge_id = job_data["challenge_id"]
+    challenge_data = ongoing_challenges.get(challenge_id)
+    if not challenge_data:
+        return
+    
+    after = []
+    async with challenge_data.lock:
+        # The game may have been cleared (or replaced) in the meantime
+        if ongoing_challenges.get(challenge_id) is not challenge_data or challenge_data.game_id != job_data["game_id"]:
+            return
+        await advance_round(context, challenge_id, challenge_data, after)
+    await run_deferred(after)
+
+async def advance_round(context, challenge_id, challenge_data, after):
+    """Finish the game or start its next round; the caller holds the challenge lock and runs ``after``."""
+    # Check if game is over
+    if challenge_data.current_round == challenge_data.rounds:
+        close_game(challenge_data)
+        after.append(partial(end_game, context, challenge_data))
+        return
+    
+    challenger_name = challenge_data.challenger_name
+    challenged_name = challenge_data.challenged_name
+    
+    # Prepare for next round
+    challenge_data.current_round += 1
+    challenge_timers.schedule(challenge_id, TURN_TIMEOUT, "turn", challenge_data)
+    fast = challenge_data.mode == "fast"
+    challenge_data.current_player = BOTH_PLAYERS if fast else challenge_data.challenger_id
+    
+    # Update message for next round
+    await outbound.edit_message_text(
+        context.bot,
+        chat_id=challenge_data.chat_id,
+        message_id=challenge_data.message_id,
+        text=f"🎮 <b>Game Continues</b> 🎮\n\n"
+            f"<b>{challenger_name}</b> vs <b>{challenged_name}</b>\n"
+            f"<b>Round {challenge_data.current_round}/{challenge_data.rounds}</b>\n\n"
+            f"<b>Score:</b>\n"
+            f"{challenger_name}: {challenge_data.challenger_score}\n"
+            f"{challenged_name}: {challenge_data.challenged_score}\n\n"
+            f"{turn_prompt(challenge_data)}",
+        reply_markup=fast_move_keyboard() if fast else None,
+        parse_mode=ParseMode.HTML
+    )
+    if fast:
+        return
+    
+    # Send move buttons to challenger
+    after.append(partial(
+        send_move_buttons, context.bot, challenge_id, challenge_data.chat_id,
+        challenge_data.challenger_id, challenger_name
+    ))
+
+def close_game(challenge_data):
+    """Take a finished game out of play; the caller holds the challenge lock."""
+    ongoing_challenges.pop(challenge_data.challenge_id)
+    challenge_timers.cancel(challenge_data.challenge_id)
+
+async def end_game(context, challenge_data, forfeit_id=None):
+    """Record a closed game and display final results; ``forfeit_id`` loses by timeout."""
+    challenger_id = challenge_data.challenger_id
+    challenged_id = challenge_data.challenged_id
+    challenger_name = challenge_data.challenger_name
+    challenged_name = challenge_data.challenged_name
+    challenger_score = challenge_data.challenger_score
+    challenged_score = challenge_data.challenged_score
+    game_id = challenge_data.game_id
     
     # Determine the overall winner
-    if challenger_score > challenged_score:
-        winner = challenger
-        loser = challenged
+    if forfeit_id is not None:
+        winner_id = challenged_id if forfeit_id == challenger_id else challenger_id
+        loser_id = forfeit_id
+        winner_score = challenger_score if winner_id == challenger_id else challenged_score
+        loser_score = challenged_score if winner_id == challenger_id else challenger_score
+    elif challenger_score > challenged_score:
+        winner_id, loser_id = challenger_id, challenged_id
         winner_score = challenger_score
         loser_score = challenged_score
-        winner_id = challenger.id
-        winner_result = "win"
-        loser_result = "loss"
     elif challenged_score > challenger_score:
-        winner = challenged
-        loser = challenger
+        winner_id, loser_id = challenged_id, challenger_id
         winner_score = challenged_score
         loser_score = challenger_score
-        winner_id = challenged.id
-        winner_result = "win"
-        loser_result = "loss"
     else:
-        winner = None
-        loser = None
         winner_id = None
-        winner_result = "tie"
-        loser_result = "tie"
-    
-    # Update game record with the winner
-    try:
-        await update_game_winner(game_id, winner_id)
-    except Exception as e:
-        logger.error(f"Error updating game winner for game {game_id}: {e}")
-    
-    # Get last moves for move streak tracking
-    try:
-        challenger_move, challenged_move = await get_last_moves(game_id)
-    except Exception as e:
-        logger.error(f"Error fetching last moves for game {game_id}: {e}")
-        challenger_move = None
-        challenged_move = None
+        loser_id = None
     
     # Create final result message
     result_text = (
         f"🎮 <b>Game Over!</b> 🎮\n\n"
         f"<b>Final Score:</b>\n"
-        f"{challenger.first_name}: {challenger_score}\n"
-        f"{challenged.first_name}: {challenged_score}\n\n"
+        f"{challenger_name}: {challenger_score}\n"
+        f"{challenged_name}: {challenged_score}\n\n"
     )
     
-    achievement_notifications = []
+    if forfeit_id is not None:
+        result_text += f"⌛ {challenge_data.name_of(forfeit_id)} ran out of time and forfeits.\n"
     
-    if winner:
+    if winner_id:
         result_text += (
-            f"🏆 <b>{winner.first_name} WINS!</b> 🏆\n"
+            f"🏆 <b>{challenge_data.name_of(winner_id)} WINS!</b> 🏆\n"
             f"<i>With a score of {winner_score}-{loser_score}</i>"
         )
-        
-        # Update stats for both players
-        try:
-            level_up, new_level = await update_stats(winner.id, "challenge", winner_result, challenger_move if winner.id == challenger.id else challenged_move)
-            await update_stats(loser.id, "challenge", loser_result, challenged_move if loser.id == challenged.id else challenger_move)
-        except Exception as e:
-            logger.error(f"Error updating stats for game {game_id}: {e}")
-        
-        # Update user progress
-        try:
-            winner_progress = await update_user_progress(winner.id, winner_result, challenger_move if winner.id == challenger.id else challenged_move)
-            loser_progress = await update_user_progress(loser.id, loser_result, challenged_move if loser.id == challenged.id else challenger_move)
-        except Exception as e:
-            logger.error(f"Error updating user progress for game {game_id}: {e}")
-            winner_progress = {'win_streak': 0, 'move_streak': 0}
-            loser_progress = {'win_streak': 0, 'move_streak': 0}
-        
-        # Check achievements for winner
-        try:
-            existing_achievements = await get_user_achievements(winner.id)
-            existing_types = {ach['achievement_type'] for ach in existing_achievements}
-            
-            # First win
-            winner_stats = await get_user_stats(winner.id)
-            if winner_stats['total_wins'] == 1 and 'first_win' not in existing_types:
-                await add_achievement(winner.id, "first_win", "Won your first challenge game!")
-                achievement_notifications.append(f"🎉 <b>Achievement Unlocked for {winner.first_name}:</b> First Win!")
-            
-            # Perfect victory
-            if challenge_data["rounds"] >= 3 and winner_score == challenge_data["rounds"] and 'perfect_victory' not in existing_types:
-                await add_achievement(
-                    winner.id, 
-                    "perfect_victory", 
-                    f"Won all {challenge_data['rounds']} rounds against {loser.first_name}"
-                )
-                achievement_notifications.append(f"🌟 <b>Achievement Unlocked for {winner.first_name}:</b> Perfect Victory!")
-            
-            # Streak winner
-            if winner_progress['win_streak'] >= 3 and 'streak_winner' not in existing_types:
-                await add_achievement(winner.id, "streak_winner", "Won 3 games in a row! You're on fire!")
-                achievement_notifications.append(f"🔥 <b>Achievement Unlocked for {winner.first_name}:</b> Streak Winner!")
-            
-            # Move master
-            if winner_progress['move_streak'] >= 10 and 'move_master' not in existing_types:
-                await add_achievement(winner.id, "move_master", "Mastered a move by playing it 10 times in a row!")
-                achievement_notifications.append(f"🎯 <b>Achievement Unlocked for {winner.first_name}:</b> Move Master!")
-        except Exception as e:
-            logger.error(f"Error checking achievements for winner {winner.id}: {e}")
-        
-        # Check achievements for loser (only move_master)
-        try:
-            existing_achievements = await get_user_achievements(loser.id)
-            existing_types = {ach['achievement_type'] for ach in existing_achievements}
-            
-            if loser_progress['move_streak'] >= 10 and 'move_master' not in existing_types:
-                await add_achievement(loser.id, "move_master", "Mastered a move by playing it 10 times in a row!")
-                achievement_notifications.append(f"🎯 <b>Achievement Unlocked for {loser.first_name}:</b> Move Master!")
-        except Exception as e:
-            logger.error(f"Error checking achievements for loser {loser.id}: {e}")
-        
-        # Add level up notification
-        if level_up:
-            achievement_notifications.append(f"⬆️ <b>{winner.first_name} leveled up to {new_level}!</b> ⬆️")
-            
     else:
         result_text += f"🤝 <b>It's a TIE!</b> 🤝"
-        
-        # Update stats for both players
-        try:
-            await update_stats(challenger.id, "challenge", "tie", challenger_move)
-            await update_stats(challenged.id, "challenge", "tie", challenged_move)
-        except Exception as e:
-            logger.error(f"Error updating stats for tie game {game_id}: {e}")
-        
-        # Update user progress
-        try:
-            challenger_progress = await update_user_progress(challenger.id, "tie", challenger_move)
-            challenged_progress = await update_user_progress(challenged.id, "tie", challenged_move)
-        except Exception as e:
-            logger.error(f"Error updating user progress for tie game {game_id}: {e}")
-            challenger_progress = {'win_streak': 0, 'move_streak': 0}
-            challenged_progress = {'win_streak': 0, 'move_streak': 0}
-        
-        # Check achievements for both players (only move_master)
-        for player, move, progress in [
-            (challenger, challenger_move, challenger_progress),
-            (challenged, challenged_move, challenged_progress)
-        ]:
-            try:
-                existing_achievements = await get_user_achievements(player.id)
-                existing_types = {ach['achievement_type'] for ach in existing_achievements}
-                
-                if progress['move_streak'] >= 10 and 'move_master' not in existing_types:
-                    await add_achievement(player.id, "move_master", "Mastered a move by playing it 10 times in a row!")
-                    achievement_notifications.append(f"🎯 <b>Achievement Unlocked for {player.first_name}:</b> Move Master!")
-            except Exception as e:
-                logger.error(f"Error checking achievements for player {player.id}: {e}")
+    
+    # Played rounds with the winner of each
+    round_winners = {"challenger": challenger_id, "challenged": challenged_id, "tie": None}
+    round_rows = [
+        (round_number, challenger_move, challenged_move,
+         round_winners[determine_winner(challenger_move, challenged_move)[0]])
+        for round_number, challenger_move, challenged_move in challenge_data.played_rounds()
+    ]
+    
+    # Record rounds, winner, stats, progress and achievements in one transaction
+    achievement_notifications = []
+    try:
+        outcome = await finalize_game(
+            game_id,
+            challenger_id,
+            challenged_id,
+            winner_id,
+            challenge_data.rounds,
+            winner_score=winner_score if winner_id else 0,
+            loser_name=challenge_data.name_of(loser_id) if loser_id else None,
+            round_rows=round_rows
+        )
+    except Exception as e:
+        logger.error(f"Error finalizing game {game_id}: {e}")
+        outcome = {'levels': {}, 'achievements': []}
+    
+    for player_id, achievement_type in outcome['achievements']:
+        title, icon = ACHIEVEMENT_TITLES[achievement_type]
+        achievement_notifications.append(
+            f"{icon} <b>Achievement Unlocked for {challenge_data.name_of(player_id)}:</b> {title}!"
+        )
+    
+    # Add level up notification
+    if winner_id:
+        level_up, new_level = outcome['levels'].get(winner_id, (False, None))
+        if level_up:
+            achievement_notifications.append(f"⬆️ <b>{challenge_data.name_of(winner_id)} leveled up to {new_level}!</b> ⬆️")
     
     # Append achievement notifications
     if achievement_notifications:
@@ -586,32 +728,30 @@ async def end_game(context, challenge_data):
     
     # Send final result message
     try:
-        await context.bot.edit_message_text(
-            chat_id=challenge_data["chat_id"],
-            message_id=challenge_data["message_id"],
+        await outbound.edit_message_text(
+            context.bot,
+            chat_id=challenge_data.chat_id,
+            message_id=challenge_data.message_id,
             text=result_text,
-            parse_mode=ParseMode.HTML
+            parse_mode=ParseMode.HTML,
+            coalesce=False
         )
     except Exception as e:
         logger.error(f"Error sending result message for game {game_id}: {e}")
     
     # Add rematch button
     keyboard = [
-        [InlineKeyboardButton("🔄 Rematch", callback_data=f"rematch_{challenger.id}_{challenged.id}")]
+        [InlineKeyboardButton("🔄 Rematch", callback_data=f"rematch_{challenger_id}_{challenged_id}")]
     ]
     try:
-        await context.bot.send_message(
-            chat_id=challenge_data["chat_id"],
+        await outbound.send_message(
+            context.bot,
+            chat_id=challenge_data.chat_id,
             text="Want to play again?",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
     except Exception as e:
         logger.error(f"Error sending rematch button for game {game_id}: {e}")
-    
-    # Remove challenge from ongoing list
-    challenge_id = f"{challenger.id}_{challenged.id}"
-    if challenge_id in ongoing_challenges:
-        del ongoing_challenges[challenge_id]
 
 async def handle_rematch(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle rematch callback query."""
@@ -640,10 +780,13 @@ async def handle_rematch(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("⚠️ You are not part of this game!")
         return
     
+    async with chat_lock(chat_id):
+        await _create_rematch(context, query, chat_id, user, challenger_id, challenged_id)
+
+async def _create_rematch(context, query, chat_id, user, challenger_id, challenged_id):
+    """Register a rematch challenge; the caller holds the chat lock."""
     # Check for ongoing challenges
-    challenge_id = f"{challenger_id}_{challenged_id}"
-    reverse_challenge_id = f"{challenged_id}_{challenger_id}"
-    if challenge_id in ongoing_challenges or reverse_challenge_id in ongoing_challenges:
+    if ongoing_challenges.between(challenger_id, challenged_id) is not None:
         await query.message.reply_text("⚠️ A challenge is already ongoing between these players!")
         return
     
@@ -657,65 +800,50 @@ async def handle_rematch(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Start new challenge (reuse existing challenge logic)
     try:
-        # Assume start_challenge is a function that initiates a challenge
-        # Replace with your actual challenge initiation logic
-        challenge_data = {
-            "challenger": await context.bot.get_chat_member(chat_id, new_challenger_id).user,
-            "challenged": await context.bot.get_chat_member(chat_id, new_challenged_id).user,
-            "chat_id": chat_id,
-            "rounds": 3,  # Default to best of 3, adjust as needed
-            "challenger_score": 0,
-            "challenged_score": 0,
-            "current_round": 1
-        }
-        
-        # Record new game
-        game_id = await record_game(
-            player1_id=new_challenger_id,
-            player2_id=new_challenged_id,
-            winner_id=None,
-            game_type="challenge",
-            rounds=challenge_data["rounds"],
-            group_id=chat_id if query.message.chat.type != "private" else None
+        challenger_member = await context.bot.get_chat_member(chat_id, new_challenger_id)
+        challenged_member = await context.bot.get_chat_member(chat_id, new_challenged_id)
+        challenge_data = ChallengeState(
+            challenger_id=new_challenger_id,
+            challenged_id=new_challenged_id,
+            challenger_name=challenger_member.user.first_name,
+            challenged_name=challenged_member.user.first_name,
+            chat_id=chat_id,
+            rounds=3,  # Default to best of 3, adjust as needed
+            timestamp=asyncio.get_event_loop().time()
         )
-        challenge_data["game_id"] = game_id
-        
+    
         # Add to ongoing challenges
-        ongoing_challenges[f"{new_challenger_id}_{new_challenged_id}"] = challenge_data
-        
+        challenge_id = challenge_data.challenge_id
+        ongoing_challenges[challenge_id] = challenge_data
+    
         # Send challenge request
         keyboard = [
             [InlineKeyboardButton("✅ Accept", callback_data=f"accept_{new_challenger_id}_{new_challenged_id}")],
             [InlineKeyboardButton("❌ Decline", callback_data=f"decline_{new_challenger_id}_{new_challenged_id}")]
         ]
-        await context.bot.send_message(
+        await outbound.send_message(
+            context.bot,
             chat_id=chat_id,
             text=(
                 f"🔥 <b>Rematch Challenge!</b> 🔥\n"
-                f"{challenge_data['challenger'].first_name} challenges {challenge_data['challenged'].first_name} "
-                f"to a {challenge_data['rounds']}-round game!\n"
+                f"{challenge_data.challenger_name} challenges {challenge_data.challenged_name} "
+                f"to a {challenge_data.rounds}-round game!\n"
                 f"Do you accept?"
             ),
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.HTML
         )
-        
+    
+        # Schedule challenge expiry
+        challenge_timers.schedule(challenge_id, CHALLENGE_EXPIRY, "expiry", challenge_data)
+    
         # Delete rematch button message
-        await query.message.delete()
+        await outbound.delete_message(context.bot, chat_id, query.message.message_id)
     except Exception as e:
         logger.error(f"Error starting rematch for users {new_challenger_id} vs {new_challenged_id}: {e}")
         await query.message.reply_text("⚠️ Error starting rematch. Please try again.")
 
 
-async def update_game_winner(game_id, winner_id):
-    """Update the game record with the winner ID."""
-    async with get_db_connection() as conn:
-        await conn.execute(
-            "UPDATE game_history SET winner_id = ? WHERE game_id = ?",
-            (winner_id, game_id)
-        )
-        await conn.commit()
-
 # Handle rematch requests
 async def rematch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -736,21 +864,16 @@ async def rematch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Create a new challenge with the same settings as before
         challenge_id = f"{challenger_user.id}_{challenged_user.id}"
         
-        ongoing_challenges[challenge_id] = {
-            "challenger": challenger_user,
-            "challenged": challenged_user,
-            "rounds": 3,  # Default to 3 rounds for rematches
-            "current_round": 1,
-            "challenger_score": 0,
-            "challenged_score": 0,
-            "status": "pending",
-            "chat_id": query.message.chat_id,
-            "moves": {
-                "challenger": [],
-                "challenged": []
-            },
-            "timestamp": asyncio.get_event_loop().time()
-        }
+        state = ChallengeState(
+            challenger_id=challenger_user.id,
+            challenged_id=challenged_user.id,
+            challenger_name=challenger_user.first_name,
+            challenged_name=challenged_user.first_name,
+            chat_id=query.message.chat_id,
+            rounds=3,  # Default to 3 rounds for rematches
+            timestamp=asyncio.get_event_loop().time()
+        )
+        ongoing_challenges[challenge_id] = state
         
         # Send rematch challenge message
         keyboard = [
@@ -769,11 +892,7 @@ async def rematch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         # Schedule challenge expiry
-        context.job_queue.run_once(
-            challenge_expiry, 
-            300,  # 5 minutes
-            data={"challenge_id": challenge_id, "chat_id": query.message.chat_id}
-        )
+        challenge_timers.schedule(challenge_id, CHALLENGE_EXPIRY, "expiry", state)
         
     except Exception as e:
         print(f"Error in rematch: {e}")
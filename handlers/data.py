@@ -1,7 +1,10 @@
 import logging
 import asyncio
 import sqlite3
-from database.connection import get_db_connection, ensure_tables_exist  
+from database.connection import get_db_connection, discard_pending_activity
+from database.ranks import rank_index
+from database.cache import leaderboard_cache, profile_cache
+from database.move_model import move_models
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
@@ -17,30 +20,32 @@ async def is_admin(user_id: int) -> bool:
     """Check if the user is an admin."""
     return user_id in ADMIN_IDS
 
-async def migrate_schema():
-    """Migrate the database to the latest schema by recreating tables."""
+# Tables cleared by a full wipe, children before parents
+WIPE_TABLES = [
+    'round_details', 'game_history', 'achievements', 'user_progress',
+    'group_stats', 'bot_daily_stats', 'move_models', 'bot_stats', 'stats', 'groups', 'users'
+]
+
+async def wipe_all_data():
+    """Delete every row while keeping the (versioned) schema in place."""
+    discard_pending_activity()
+    rank_index.reset()
+    leaderboard_cache.clear()
+    profile_cache.clear()
+    move_models.clear()
     async with get_db_connection() as conn:
         try:
-            # Drop all existing tables
-            await conn.execute('DROP TABLE IF EXISTS users')
-            await conn.execute('DROP TABLE IF EXISTS groups')
-            await conn.execute('DROP TABLE IF EXISTS stats')
-            await conn.execute('DROP TABLE IF EXISTS bot_stats')
-            await conn.execute('DROP TABLE IF EXISTS game_history')
-            await conn.execute('DROP TABLE IF EXISTS round_details')
-            await conn.execute('DROP TABLE IF EXISTS achievements')
+            for table in WIPE_TABLES:
+                await conn.execute(f'DELETE FROM {table}')
             await conn.commit()
-            
-            # Recreate tables with the latest schema
-            await ensure_tables_exist()
-            logger.info("Database schema migrated successfully.")
+            logger.info("All database data wiped.")
         except sqlite3.Error as e:
-            logger.error(f"Error migrating schema: {e}")
+            logger.error(f"Error wiping database: {e}")
             raise
 
 async def list_users() -> str:
     """List all users in the database."""
-    async with get_db_connection() as conn:
+    async with get_db_connection(readonly=True) as conn:
         async with conn.execute('''
             SELECT user_id, first_name, last_name, username, joined_date, last_active
             FROM users
@@ -64,7 +69,7 @@ async def list_users() -> str:
 
 async def list_groups() -> str:
     """List all groups in the database."""
-    async with get_db_connection() as conn:
+    async with get_db_connection(readonly=True) as conn:
         async with conn.execute('''
             SELECT group_id, title, username, joined_date, last_active, member_count
             FROM groups
@@ -89,12 +94,20 @@ async def list_groups() -> str:
 
 async def delete_user_data(user_id: int) -> str:
     """Delete all data related to a specific user."""
+    discard_pending_activity(user_id=user_id)
+    rank_index.remove(user_id)
+    leaderboard_cache.clear()
+    profile_cache.invalidate(user_id)
+    move_models.discard(user_id)
     async with get_db_connection() as conn:
         try:
             # Delete from related tables first to avoid foreign key constraints
             await conn.execute('DELETE FROM stats WHERE user_id = ?', (user_id,))
             await conn.execute('DELETE FROM bot_stats WHERE user_id = ?', (user_id,))
+            await conn.execute('DELETE FROM bot_daily_stats WHERE user_id = ?', (user_id,))
+            await conn.execute('DELETE FROM move_models WHERE user_id = ?', (user_id,))
             await conn.execute('DELETE FROM achievements WHERE user_id = ?', (user_id,))
+            await conn.execute('DELETE FROM group_stats WHERE user_id = ?', (user_id,))
             await conn.execute('DELETE FROM round_details WHERE game_id IN (SELECT game_id FROM game_history WHERE player1_id = ? OR player2_id = ?)', (user_id, user_id))
             await conn.execute('DELETE FROM game_history WHERE player1_id = ? OR player2_id = ? OR winner_id = ?', (user_id, user_id, user_id))
             await conn.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
@@ -107,11 +120,14 @@ async def delete_user_data(user_id: int) -> str:
 
 async def delete_group_data(group_id: int) -> str:
     """Delete all data related to a specific group."""
+    discard_pending_activity(group_id=group_id)
+    leaderboard_cache.invalidate_group(group_id)
     async with get_db_connection() as conn:
         try:
             # Delete related game history first
             await conn.execute('DELETE FROM round_details WHERE game_id IN (SELECT game_id FROM game_history WHERE group_id = ?)', (group_id,))
             await conn.execute('DELETE FROM game_history WHERE group_id = ?', (group_id,))
+            await conn.execute('DELETE FROM group_stats WHERE group_id = ?', (group_id,))
             await conn.execute('DELETE FROM groups WHERE group_id = ?', (group_id,))
             await conn.commit()
             logger.info(f"Deleted data for group {group_id}")
@@ -230,9 +246,9 @@ async def manage_data_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 
     if action == "confirm_wipe_all":
         try:
-            await migrate_schema()
+            await wipe_all_data()
             await query.edit_message_text(
-                "✅ <b>Success</b>: All database data has been wiped and the schema has been updated.",
+                "✅ <b>Success</b>: All database data has been wiped.",
                 parse_mode="HTML"
             )
             logger.info(f"User {user.id} wiped all database data.")
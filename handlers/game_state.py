@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+
+# One byte per move; 0 means no move yet
+MOVE_CODES = {"rock": 1, "paper": 2, "scissor": 3}
+MOVE_NAMES = (None, "rock", "paper", "scissor")
+# current_player while both players pick at once (fast mode)
+BOTH_PLAYERS = 0
+
+@dataclass(slots=True)
+class ChallengeState:
+    """One challenge between two players, holding only ids, names and counters.
+
+    Resolved rounds are stored in ``moves`` as byte pairs
+    (challenger, challenged) using ``MOVE_CODES``.
+    """
+    challenger_id: int
+    challenged_id: int
+    challenger_name: str
+    challenged_name: str
+    chat_id: int
+    rounds: int
+    current_round: int = 1
+    challenger_score: int = 0
+    challenged_score: int = 0
+    status: str = "pending"
+    timestamp: float = 0.0
+    game_id: int | None = None
+    message_id: int | None = None
+    current_player: int | None = None
+    mode: str = "classic"
+    challenger_move: int = 0
+    challenged_move: int = 0
+    moves: bytearray = field(default_factory=bytearray)
+    # Serialises handlers touching this game when updates run concurrently
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False, compare=False)
+
+    @property
+    def challenge_id(self):
+        return f"{self.challenger_id}_{self.challenged_id}"
+
+    def name_of(self, player_id):
+        return self.challenger_name if player_id == self.challenger_id else self.challenged_name
+
+    def set_move(self, player_id, move):
+        """Hold a player's pick for the current round."""
+        if player_id == self.challenger_id:
+            self.challenger_move = MOVE_CODES[move]
+        else:
+            self.challenged_move = MOVE_CODES[move]
+
+    def has_moved(self, player_id):
+        """Whether the player already picked in the current round."""
+        if player_id == self.challenger_id:
+            return self.challenger_move != 0
+        return self.challenged_move != 0
+
+    def pending_moves(self):
+        """Both picks for the current round by name (None if not made yet)."""
+        return MOVE_NAMES[self.challenger_move], MOVE_NAMES[self.challenged_move]
+
+    def close_round(self):
+        """Store the current round's picks and clear them for the next round."""
+        self.moves.append(self.challenger_move)
+        self.moves.append(self.challenged_move)
+        self.challenger_move = 0
+        self.challenged_move = 0
+
+    def played_rounds(self):
+        """``(round_number, challenger_move, challenged_move)`` for every resolved round."""
+        return [
+            (index // 2 + 1, MOVE_NAMES[self.moves[index]], MOVE_NAMES[self.moves[index + 1]])
+            for index in range(0, len(self.moves), 2)
+        ]
+
+    def player_moves(self, player_id):
+        """Resolved moves of one player by name, in round order."""
+        offset = 0 if player_id == self.challenger_id else 1
+        return [MOVE_NAMES[code] for code in self.moves[offset::2]]
+
+
+class ChallengeRegistry:
+    """Ongoing challenges keyed by challenge id, with secondary indexes.
+
+    Lookups by player, chat and message id are O(1). Every insert and delete
+    keeps the indexes in step with the primary mapping.
+    """
+
+    def __init__(self):
+        self._challenges = {}
+        self._by_player = {}
+        self._by_chat = {}
+        self._by_message = {}
+        self._messages = {}
+
+    @staticmethod
+    def _players(data):
+        return (data.challenger_id, data.challenged_id)
+
+    def __contains__(self, challenge_id):
+        return challenge_id in self._challenges
+
+    def __len__(self):
+        return len(self._challenges)
+
+    def __iter__(self):
+        return iter(self._challenges)
+
+    def __getitem__(self, challenge_id):
+        return self._challenges[challenge_id]
+
+    def __setitem__(self, challenge_id, data):
+        self.add(challenge_id, data)
+
+    def __delitem__(self, challenge_id):
+        if self.pop(challenge_id) is None:
+            raise KeyError(challenge_id)
+
+    def get(self, challenge_id, default=None):
+        return self._challenges.get(challenge_id, default)
+
+    def items(self):
+        return self._challenges.items()
+
+    def values(self):
+        return self._challenges.values()
+
+    def add(self, challenge_id, data):
+        """Register a challenge, replacing any previous entry with the same id."""
+        if challenge_id in self._challenges:
+            self.pop(challenge_id)
+        self._challenges[challenge_id] = data
+        for player_id in self._players(data):
+            self._by_player.setdefault(player_id, set()).add(challenge_id)
+        self._by_chat.setdefault(data.chat_id, set()).add(challenge_id)
+
+    def pop(self, challenge_id):
+        """Remove a challenge and all of its index entries; returns it or None."""
+        data = self._challenges.pop(challenge_id, None)
+        if data is None:
+            return None
+        for player_id in self._players(data):
+            self._discard(self._by_player, player_id, challenge_id)
+        self._discard(self._by_chat, data.chat_id, challenge_id)
+        for key in self._messages.pop(challenge_id, ()):
+            self._by_message.pop(key, None)
+        return data
+
+    def clear(self):
+        self._challenges.clear()
+        self._by_player.clear()
+        self._by_chat.clear()
+        self._by_message.clear()
+        self._messages.clear()
+
+    @staticmethod
+    def _discard(index, key, challenge_id):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(challenge_id)
+            if not ids:
+                del index[key]
+
+    def bind_message(self, challenge_id, chat_id, message_id):
+        """Index a message (status or move buttons) that belongs to a challenge."""
+        if challenge_id not in self._challenges:
+            return
+        key = (chat_id, message_id)
+        self._by_message[key] = challenge_id
+        self._messages.setdefault(challenge_id, set()).add(key)
+
+    def unbind_message(self, chat_id, message_id):
+        key = (chat_id, message_id)
+        challenge_id = self._by_message.pop(key, None)
+        if challenge_id is not None:
+            self._discard(self._messages, challenge_id, key)
+
+    def by_message(self, chat_id, message_id):
+        """Challenge id a message belongs to, or None."""
+        return self._by_message.get((chat_id, message_id))
+
+    def for_player(self, player_id):
+        """Ids of all challenges the player takes part in."""
+        return set(self._by_player.get(player_id, ()))
+
+    def in_chat(self, chat_id):
+        """Ids of all challenges in a chat."""
+        return set(self._by_chat.get(chat_id, ()))
+
+    def for_player_in_chat(self, player_id, chat_id):
+        return self.for_player(player_id) & self._by_chat.get(chat_id, set())
+
+    def between(self, player_a, player_b):
+        """Id of a challenge between two players in either direction, or None."""
+        for challenge_id in self._by_player.get(player_a, ()):
+            if player_b in self._players(self._challenges[challenge_id]):
+                return challenge_id
+        return None
+
+
+class TimerQueue:
+    """Deadlines keyed by challenge id in a min-heap, drained by one ticking job.
+
+    Each key holds at most one timer; scheduling again replaces it. Cancelling
+    is O(1): the heap entry is only marked dead and dropped when it surfaces.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def schedule(self, key, delay, kind, payload=None):
+        """Fire ``(key, kind, payload)`` once ``delay`` seconds have passed."""
+        self.cancel(key)
+        entry = [time.monotonic() + delay, next(self._counter), key, kind, payload]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def cancel(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[2] = None
+
+    def pop_due(self, now=None):
+        """Remove and return every live timer whose deadline has passed."""
+        now = time.monotonic() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key, kind, payload = heapq.heappop(self._heap)
+            if key is None:
+                continue
+            del self._entries[key]
+            due.append((key, kind, payload))
+        return due
+
+    def clear(self):
+        self._heap.clear()
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,126 @@
+import logging
+import os
+from telegram import Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+from database.connection import get_media_file_ids, save_media_file_id, delete_media_file_id, is_admin
+
+logger = logging.getLogger(__name__)
+
+# Images the bot sends, by name
+MEDIA_URLS = {
+    "welcome": "https://files.catbox.moe/qrswmu.jpg",
+}
+
+# Chat that gets a throwaway upload of every uncached image at startup (unset = no warm-up)
+MEDIA_WARMUP_CHAT_ID = os.getenv("MEDIA_WARMUP_CHAT_ID")
+
+class MediaCache:
+    """Telegram file_ids of the images in ``MEDIA_URLS``.
+
+    The first send of an image uploads it from its URL; the file_id Telegram
+    returns is kept in memory and in the media_cache table and used for every
+    later send, so the external host is only hit once.
+    """
+
+    def __init__(self):
+        self._file_ids = {}
+        self.hits = 0
+        self.uploads = 0
+
+    async def load(self):
+        """Read saved file_ids, skipping ones recorded for a URL that has changed."""
+        rows = await get_media_file_ids()
+        self._file_ids = {
+            key: file_id for key, (url, file_id) in rows.items() if MEDIA_URLS.get(key) == url
+        }
+        return len(self._file_ids)
+
+    async def _remember(self, key, message):
+        if message is None or not message.photo:
+            return
+        file_id = message.photo[-1].file_id
+        if self._file_ids.get(key) == file_id:
+            return
+        self._file_ids[key] = file_id
+        try:
+            await save_media_file_id(key, MEDIA_URLS[key], file_id)
+        except Exception as e:
+            logger.error(f"Error saving file_id for {key}: {e}")
+
+    async def forget(self, key):
+        """Drop a file_id so the next send uploads the image again."""
+        self._file_ids.pop(key, None)
+        await delete_media_file_id(key)
+
+    async def send_photo(self, send, key, **kwargs):
+        """Send image ``key`` through ``send`` (e.g. ``message.reply_photo``).
+
+        Uses the cached file_id when there is one; if Telegram rejects it the
+        entry is dropped and the image is uploaded from its URL instead.
+        """
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            try:
+                message = await send(photo=file_id, **kwargs)
+                self.hits += 1
+                return message
+            except BadRequest as e:
+                logger.warning(f"Cached file_id for {key} was rejected ({e}), uploading from URL")
+                await self.forget(key)
+
+        message = await send(photo=MEDIA_URLS[key], **kwargs)
+        self.uploads += 1
+        await self._remember(key, message)
+        return message
+
+    async def warm_up(self, bot, chat_id):
+        """Upload every uncached image to ``chat_id`` once, then delete the messages."""
+        async def send(**kwargs):
+            return await bot.send_photo(chat_id=chat_id, disable_notification=True, **kwargs)
+
+        warmed = 0
+        for key in MEDIA_URLS:
+            if key in self._file_ids:
+                continue
+            message = await self.send_photo(send, key)
+            warmed += 1
+            try:
+                await bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+            except Exception as e:
+                logger.warning(f"Could not delete warm-up upload of {key}: {e}")
+        return warmed
+
+    def stats(self):
+        return {
+            'entries': len(self._file_ids),
+            'hits': self.hits,
+            'uploads': self.uploads,
+        }
+
+
+# Shared file_id cache for outgoing images
+media_cache = MediaCache()
+
+async def refresh_media_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command: /refreshmedia [name ...] re-uploads images from their URLs."""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("⛔ You are not authorized to use this command.")
+        return
+
+    keys = context.args or list(MEDIA_URLS)
+    unknown = [key for key in keys if key not in MEDIA_URLS]
+    if unknown:
+        await update.message.reply_text(
+            f"⚠️ Unknown media: {', '.join(unknown)}\n"
+            f"Known media: {', '.join(MEDIA_URLS)}"
+        )
+        return
+
+    for key in keys:
+        try:
+            await media_cache.forget(key)
+            await media_cache.send_photo(update.message.reply_photo, key, caption=f"🖼 {key} refreshed")
+        except Exception as e:
+            logger.error(f"Error refreshing media {key}: {e}")
+            await update.message.reply_text(f"⚠️ Error refreshing {key}: {e}")
@@ -0,0 +1,59 @@
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Number of recent samples kept per timed operation
+LATENCY_SAMPLES = int(os.getenv("LATENCY_SAMPLES", "1000"))
+
+class LatencyTracker:
+    """Rolling latency samples per operation name, summarised as percentiles."""
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self.size = size
+        self._samples = {}
+        self._counts = {}
+
+    def record(self, name, seconds):
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.size)
+        samples.append(seconds)
+        self._counts[name] = self._counts.get(name, 0) + 1
+
+    @contextmanager
+    def timer(self, name):
+        """Time the ``with`` block and record it under ``name``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    @staticmethod
+    def _percentile(ordered, fraction):
+        index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self, name):
+        """Count, p50 and p99 in milliseconds for one operation, or None."""
+        samples = self._samples.get(name)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return {
+            'count': self._counts[name],
+            'p50': round(self._percentile(ordered, 0.50) * 1000, 1),
+            'p99': round(self._percentile(ordered, 0.99) * 1000, 1),
+        }
+
+    def stats(self):
+        return {name: self.summary(name) for name in self._samples}
+
+    def clear(self):
+        self._samples.clear()
+        self._counts.clear()
+
+
+# Shared latency tracker for hot handler paths
+latency = LatencyTracker()
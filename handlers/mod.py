@@ -10,8 +10,15 @@ from database.connection import (
     get_broadcast_users,
     get_user_achievements,
     get_group_leaderboard,
-    is_admin
+    is_admin,
+    BOT_GAME_STORAGE
 )
+from database.cache import leaderboard_cache, profile_cache
+from database.move_model import move_models
+from handlers.challenge import challenge_timer_stats
+from handlers.outbound import outbound
+from handlers.metrics import latency
+from handlers.media import media_cache
 from datetime import datetime, timedelta
 import asyncio
 import logging
@@ -34,15 +41,15 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif context.args:
         # Attempt to find user by username
         username = context.args[0].lstrip('@')
-        async with get_db_connection() as conn:
+        async with get_db_connection(readonly=True) as conn:
             async with conn.execute('SELECT user_id FROM users WHERE username = ?', (username,)) as cursor:
                 user_row = await cursor.fetchone()
-                if user_row:
-                    target_user_id = user_row['user_id']
-                    stats = await get_user_stats(target_user_id)
-                else:
-                    await update.message.reply_text(f"⚠️ User @{username} not found in the database.")
-                    return
+        if user_row:
+            target_user_id = user_row['user_id']
+            stats = await get_user_stats(target_user_id)
+        else:
+            await update.message.reply_text(f"⚠️ User @{username} not found in the database.")
+            return
     elif update.message.reply_to_message:
         # Get stats for the replied-to user
         target_user = update.message.reply_to_message.from_user
@@ -122,7 +129,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Add achievements button
     keyboard = [
-        [InlineKeyboardButton("🏅 View Achievements", callback_data=f"achievements_{stats['user_id'] if target_user else user.id}")]
+        [InlineKeyboardButton("🏅 View Achievements", callback_data=f"achievements_{stats['user_id']}")]
     ]
     
     try:
@@ -194,8 +201,7 @@ async def back_to_stats_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     
-    _, user_id = query.data.split("_")
-    user_id = int(user_id)
+    user_id = int(query.data.rsplit("_", 1)[1])
     
     # Get user stats
     stats = await get_user_stats(user_id)
@@ -338,6 +344,25 @@ async def format_leaderboard(leaders: list, category: str, is_group: bool = Fals
     
     return leaderboard_message, InlineKeyboardMarkup(keyboard)
 
+async def leaderboard_view(category: str, is_group: bool = False, group_id: int = None, limit: int = 10) -> tuple[str, InlineKeyboardMarkup]:
+    """Fetch and format a leaderboard, reusing cached output while it is still valid."""
+    scope = "group" if is_group else "global"
+    scope_id = group_id if is_group else None
+    # The global board rendered from a group also carries a "back to group" button
+    view = group_id
+    
+    rendered = leaderboard_cache.get_rendered(scope, scope_id, category, limit, view)
+    if rendered is not None:
+        return rendered
+    
+    if is_group:
+        leaders = await get_group_leaderboard(group_id, category, limit)
+    else:
+        leaders = await get_leaderboard(category, limit)
+    rendered = await format_leaderboard(leaders, category, is_group=is_group, group_id=group_id)
+    leaderboard_cache.put_rendered(scope, scope_id, category, limit, view, rendered)
+    return rendered
+
 
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show the game leaderboard (global in PM, group-specific in GC)."""
@@ -372,7 +397,7 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 [InlineKeyboardButton("🔙 Back", callback_data="back")]
             ])
         else:
-            message, keyboard = await format_leaderboard(leaders, category, is_group=not is_private, group_id=group_id)
+            message, keyboard = await leaderboard_view(category, is_group=not is_private, group_id=group_id)
 
         await update.message.reply_text(message, parse_mode=ParseMode.HTML, reply_markup=keyboard)
 
@@ -386,8 +411,16 @@ async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    data = query.data.split("_")
-    action = data[0]
+    # Callback data is "<action>_<category>_<group_id>" and categories may contain "_"
+    action = query.data
+    data = []
+    for prefix in ("leaderboard_switch_to_global", "leaderboard_switch_to_group", "leaderboard_group", "leaderboard"):
+        if query.data.startswith(prefix + "_"):
+            action = prefix
+            data = [prefix] + query.data[len(prefix) + 1:].rsplit("_", 1)
+            break
+    if len(data) != 3:
+        return
     
     if action in ("leaderboard", "leaderboard_group"):
         is_group = action == "leaderboard_group"
@@ -399,12 +432,7 @@ async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             return
         
         try:
-            if is_group:
-                leaders = await get_group_leaderboard(group_id, category, 10)
-                message, keyboard = await format_leaderboard(leaders, category, is_group=True, group_id=group_id)
-            else:
-                leaders = await get_leaderboard(category, 10)
-                message, keyboard = await format_leaderboard(leaders, category, group_id=group_id)
+            message, keyboard = await leaderboard_view(category, is_group=is_group, group_id=group_id)
             
             # Check if message has text or is media
             if query.message.text or query.message.caption:
@@ -441,8 +469,7 @@ async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             return
         
         try:
-            leaders = await get_leaderboard(category, 10)
-            message, keyboard = await format_leaderboard(leaders, category, group_id=group_id)
+            message, keyboard = await leaderboard_view(category, group_id=group_id)
             
             if query.message.text or query.message.caption:
                 if query.message.caption:
@@ -477,8 +504,7 @@ async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             return
         
         try:
-            leaders = await get_group_leaderboard(group_id, category, 10)
-            message, keyboard = await format_leaderboard(leaders, category, is_group=True, group_id=group_id)
+            message, keyboard = await leaderboard_view(category, is_group=True, group_id=group_id)
             
             if query.message.text or query.message.caption:
                 if query.message.caption:
@@ -594,7 +620,56 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"👥 <b>Active Users (7d):</b> {stats_data['active_users']}\n"
         f"👥 <b>Groups:</b> {stats_data['total_groups']}\n"
         f"🎮 <b>Total Games:</b> {stats_data['total_games']}\n"
+        f"🎮 <b>Challenges / Bot:</b> {stats_data['challenge_games']} / {stats_data['bot_games']}\n"
     )
+    if BOT_GAME_STORAGE == 'daily':
+        stats_message += (
+            f"🤖 <b>Bot Games (7d):</b> {stats_data['bot_games_7d']} "
+            f"by {stats_data['bot_players_7d']} players\n"
+        )
+    stats_message += "\n"
+    
+    cache_stats = leaderboard_cache.stats()
+    stats_message += (
+        f"🗂 <b>Leaderboard Cache:</b> {cache_stats['hits']} hits / {cache_stats['misses']} misses\n"
+        f"🗂 <b>Formatted Reuse:</b> {cache_stats['rendered_hits']} "
+        f"({cache_stats['entries']} entries, {cache_stats['invalidations']} invalidations)\n"
+    )
+    profile_stats = profile_cache.stats()
+    stats_message += (
+        f"🗂 <b>Profile Cache:</b> {profile_stats['hits']} hits / {profile_stats['misses']} misses "
+        f"({profile_stats['entries']} entries)\n"
+    )
+    model_stats = move_models.stats()
+    stats_message += (
+        f"🧠 <b>Move Models:</b> {model_stats['entries']} cached, {model_stats['dirty']} unsaved\n"
+    )
+    media_stats = media_cache.stats()
+    stats_message += (
+        f"🖼 <b>Media:</b> {media_stats['hits']} file_id sends, {media_stats['uploads']} URL uploads "
+        f"({media_stats['entries']} cached)\n"
+    )
+    
+    timer_stats = challenge_timer_stats()
+    stats_message += (
+        f"⏱ <b>Challenges:</b> {timer_stats['ongoing']} ongoing, {timer_stats['timers']} live timers\n"
+        f"⏱ <b>Reaped:</b> {timer_stats['expired']} expired, {timer_stats['forfeited']} forfeited\n"
+    )
+    
+    outbound_stats = outbound.stats()
+    stats_message += (
+        f"📤 <b>Outbound:</b> {outbound_stats['sent']} sent, {outbound_stats['queued']} queued, "
+        f"{outbound_stats['throttled']} throttled, {outbound_stats['retries']} flood retries\n"
+        f"📤 <b>Edits Saved:</b> {outbound_stats['coalesced']} coalesced, {outbound_stats['skipped']} unchanged\n"
+    )
+    
+    for name, label in (('bot_game', 'Bot Game'), ('bot_game_db', 'Bot Game DB')):
+        timing = latency.summary(name)
+        if timing:
+            stats_message += (
+                f"⚡ <b>{label}:</b> p50 {timing['p50']} ms, p99 {timing['p99']} ms "
+                f"({timing['count']} games)\n"
+            )
     await update.message.reply_text(
         stats_message,
         parse_mode=ParseMode.HTML
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Outbound rate limits (Telegram allows roughly 30 messages/sec overall and
+# short bursts per chat before answering with RetryAfter)
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))  # calls/sec per chat
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "5"))
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))  # calls/sec overall
+OUTBOUND_GLOBAL_BURST = int(os.getenv("OUTBOUND_GLOBAL_BURST", "30"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Seconds shutdown waits for queued calls to go out
+OUTBOUND_DRAIN_TIMEOUT = float(os.getenv("OUTBOUND_DRAIN_TIMEOUT", "10"))
+
+# How many recently edited messages to remember for no-op detection
+EDIT_MEMORY_SIZE = 2048
+# Idle chat buckets are pruned once there are more than this many
+CHAT_BUCKET_LIMIT = 1000
+
+class TokenBucket:
+    """Token bucket where callers reserve a token and sleep until it is due."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds):
+        """Block the bucket for ``seconds`` (after a RetryAfter from Telegram)."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def idle(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+class OutboundQueue:
+    """Rate-limited sends, edits and deletes for game messages.
+
+    Every call for a chat goes through one FIFO queue drained by a
+    background sender, so messages reach the chat in the order they were
+    made. Each call waits on a per-chat and a global token bucket. Sends
+    and deletes wait for their own turn; edits return at once. An edit
+    made right behind a still queued edit of the same message only replaces
+    its text, unless that edit was queued with ``coalesce=False``, and an
+    edit repeating the current text is skipped.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST)
+        self._chats = {}
+        self._queues = {}
+        self._senders = {}
+        self._last_edits = OrderedDict()
+        self.waiting = 0
+        self.sent = 0
+        self.throttled = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.retries = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKET_LIMIT:
+                for key in [key for key, value in self._chats.items() if value.idle()]:
+                    del self._chats[key]
+            bucket = TokenBucket(OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id):
+        delay = max(self._chat_bucket(chat_id).reserve(), self._global.reserve())
+        if delay > 0:
+            self.throttled += 1
+            self.waiting += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.waiting -= 1
+
+    async def _call(self, chat_id, method, acquired=False, **kwargs):
+        """Run one Bot API call under the rate limits, retrying RetryAfter.
+
+        ``acquired`` means the caller already waited for the first attempt.
+        """
+        attempt = 0
+        while True:
+            if not acquired:
+                await self._acquire(chat_id)
+            acquired = False
+            try:
+                result = await method(chat_id=chat_id, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                attempt += 1
+                if attempt > OUTBOUND_MAX_RETRIES:
+                    raise
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                self.retries += 1
+                logger.warning(f"Flood limit in chat {chat_id}, retrying in {delay}s")
+                self._chat_bucket(chat_id).pause(delay)
+                self._global.pause(delay)
+
+    def _enqueue(self, chat_id, job):
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        queue.append(job)
+        if chat_id not in self._senders:
+            self._senders[chat_id] = asyncio.get_running_loop().create_task(self._send_queued(chat_id))
+
+    async def _submit(self, chat_id, method, **kwargs):
+        """Queue a call behind everything already queued for the chat and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(chat_id, {'method': method, 'kwargs': kwargs, 'future': future})
+        return await future
+
+    async def send_message(self, bot, chat_id, text, **kwargs):
+        return await self._submit(chat_id, bot.send_message, text=text, **kwargs)
+
+    async def delete_message(self, bot, chat_id, message_id):
+        # Queued edits of a deleted message would only fail
+        queue = self._queues.get(chat_id)
+        if queue:
+            kept = [job for job in queue if job.get('message_id') != message_id]
+            queue.clear()
+            queue.extend(kept)
+        self._last_edits.pop((chat_id, message_id), None)
+        return await self._submit(chat_id, bot.delete_message, message_id=message_id)
+
+    async def edit_message_text(self, bot, chat_id, message_id, text, coalesce=True, **kwargs):
+        """Queue an edit and return without waiting for the rate limit.
+
+        The edit replaces the text of an edit of the same message queued
+        directly before it, unless that one was queued with
+        ``coalesce=False`` (round results and final scores that must be
+        shown). Edits that would not change the message are skipped.
+        """
+        key = (chat_id, message_id)
+        queue = self._queues.get(chat_id)
+        last = queue[-1] if queue else None
+        if last is not None and last.get('message_id') == message_id and last['coalesce']:
+            # Nothing was queued after it: send the newest text instead
+            last['kwargs'] = dict(kwargs, message_id=message_id, text=text)
+            last['coalesce'] = coalesce
+            self.coalesced += 1
+            return
+        if not queue and self._last_edits.get(key) == (text, kwargs.get('reply_markup')):
+            self.skipped += 1
+            return
+
+        self._enqueue(chat_id, {
+            'method': bot.edit_message_text,
+            'kwargs': dict(kwargs, message_id=message_id, text=text),
+            'message_id': message_id,
+            'coalesce': coalesce,
+        })
+
+    async def _send_queued(self, chat_id):
+        """Send the chat's queued calls one at a time, in order."""
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                await self._acquire(chat_id)
+                if not queue:
+                    break
+                job = queue.popleft()
+                if 'future' in job:
+                    await self._run_call(chat_id, job)
+                else:
+                    await self._run_edit(chat_id, job)
+        finally:
+            del self._senders[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+
+    async def _run_call(self, chat_id, job):
+        future = job['future']
+        try:
+            result = await self._call(chat_id, job['method'], acquired=True, **job['kwargs'])
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_edit(self, chat_id, job):
+        kwargs = job['kwargs']
+        key = (chat_id, job['message_id'])
+        edit = (kwargs['text'], kwargs.get('reply_markup'))
+        if self._last_edits.get(key) == edit:
+            self.skipped += 1
+            return
+        try:
+            await self._call(chat_id, job['method'], acquired=True, **kwargs)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.error(f"Error editing message {job['message_id']} in chat {chat_id}: {e}")
+                return
+            self.skipped += 1
+        except Exception as e:
+            logger.error(f"Error editing message {job['message_id']} in chat {chat_id}: {e}")
+            return
+        self._remember_edit(key, *edit)
+
+    def _remember_edit(self, key, text, reply_markup):
+        self._last_edits[key] = (text, reply_markup)
+        self._last_edits.move_to_end(key)
+        while len(self._last_edits) > EDIT_MEMORY_SIZE:
+            self._last_edits.popitem(last=False)
+
+    async def drain(self, timeout=OUTBOUND_DRAIN_TIMEOUT):
+        """Wait until every queued call has been sent (called on shutdown)."""
+        try:
+            async with asyncio.timeout(timeout):
+                while self._senders:
+                    await asyncio.gather(*self._senders.values(), return_exceptions=True)
+        except TimeoutError:
+            logger.warning(f"Outbound queue not drained after {timeout}s, dropping {self.queued()} calls")
+
+    def queued(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        return {
+            'waiting': self.waiting,
+            'queued': self.queued(),
+            'pending_edits': sum(
+                1 for queue in self._queues.values() for job in queue if 'message_id' in job
+            ),
+            'sent': self.sent,
+            'throttled': self.throttled,
+            'coalesced': self.coalesced,
+            'skipped': self.skipped,
+            'retries': self.retries,
+        }
+
+
+# Shared outbound queue for game messages
+outbound = OutboundQueue()
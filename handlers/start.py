@@ -3,21 +3,19 @@ from telegram.ext import Application, CommandHandler, CallbackQueryHandler, Cont
 from telegram.constants import ParseMode
 import random
 import logging
+import time
 from database.connection import (
-ensure_tables_exist,
 update_user_activity,
 get_user_stats,
-get_user_bot_stats,
-get_leaderboard,
-get_group_leaderboard,
 get_user_achievements,
-update_stats,
-record_game,
-update_bot_stats,
-record_round,
-add_achievement
+play_bot_round,
+play_bot_game,
+load_move_model
 )
-from handlers.mod import format_leaderboard
+from database.move_model import move_models
+from handlers.mod import leaderboard_view
+from handlers.metrics import latency
+from handlers.media import media_cache
 
 #Set up logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -27,14 +25,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Interactive start command with UI for the Rock Paper Scissors bot."""
     user = update.message.from_user
 
-    # Ensure database tables exist
-    try:
-        await ensure_tables_exist()
-    except Exception as e:
-        logger.error(f"Error initializing database: {e}")
-        await update.message.reply_text("Error initializing database. Please try again later.")
-        return
-    
     # Update user activity in database
     try:
         await update_user_activity(user.id, user.first_name, user.last_name, user.username)
@@ -68,6 +58,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("🎮 Quick Game (vs Bot)", callback_data="quick_game"),
             InlineKeyboardButton("👥 Challenge Friends", switch_inline_query="")
         ],
+        [
+            InlineKeyboardButton("🧠 Smart Bot", callback_data="quick_game_smart")
+        ],
         [
             InlineKeyboardButton("🏆 Leaderboard", callback_data="leaderboard"),
             InlineKeyboardButton("🌟 Achievements", callback_data="achievements")
@@ -76,8 +69,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Send the message with photo and buttons
     try:
-        await update.message.reply_photo(
-            photo="https://files.catbox.moe/qrswmu.jpg",
+        await media_cache.send_photo(
+            update.message.reply_photo,
+            "welcome",
             caption=welcome_text,
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.HTML
@@ -201,9 +195,9 @@ async def start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode=ParseMode.HTML
             )
     
-    elif action == "quick_game":
+    elif action in ("quick_game", "quick_game_smart"):
         try:
-            await start_bot_game(query, context)
+            await start_bot_game(query, context, "smart" if action == "quick_game_smart" else "random")
         except Exception as e:
             logger.error(f"Error starting bot game for user {user.id}: {e}")
             await query.edit_message_caption(
@@ -217,13 +211,10 @@ async def start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             category = "wins"
             if chat.type == "private":
                 # Show global leaderboard in PM
-                leaders = await get_leaderboard(category, 10)
-                message, keyboard = await format_leaderboard(leaders, category)
+                message, keyboard = await leaderboard_view(category)
             else:
                 # Show group leaderboard in group chat
-                group_id = chat.id
-                leaders = await get_group_leaderboard(group_id, category, 10)
-                message, keyboard = await format_leaderboard(leaders, category, is_group=True, group_id=group_id)
+                message, keyboard = await leaderboard_view(category, is_group=True, group_id=chat.id)
             
             await query.edit_message_caption(
                 caption=message,
@@ -302,6 +293,9 @@ async def start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 InlineKeyboardButton("🎮 Quick Game (vs Bot)", callback_data="quick_game"),
                 InlineKeyboardButton("👥 Challenge Friends", switch_inline_query="")
             ],
+            [
+                InlineKeyboardButton("🧠 Smart Bot", callback_data="quick_game_smart")
+            ],
             [
                 InlineKeyboardButton("🏆 Leaderboard", callback_data="leaderboard"),
                 InlineKeyboardButton("🌟 Achievements", callback_data="achievements")
@@ -322,31 +316,86 @@ async def start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode=ParseMode.HTML
             )
 
-async def start_bot_game(query, context):
-    """Start a quick game against the bot."""
+# Longest best-of-N match against the bot (same cap as /challenge)
+BOT_MATCH_MAX_ROUNDS = 10
+# Match lengths offered under a single quick game
+BOT_MATCH_CHOICES = (3, 5)
+# Move each move beats
+BEATS = {'rock': 'scissor', 'paper': 'rock', 'scissor': 'paper'}
+
+def bot_round_result(player_move, bot_move):
+    """Round result for the player: 'win', 'loss' or 'tie'."""
+    if player_move == bot_move:
+        return 'tie'
+    return 'win' if BEATS[player_move] == bot_move else 'loss'
+
+def bot_round_text(name, player_move, bot_move, result):
+    """Both moves and the round outcome, as shown after every tap."""
+    text = f"{name}: {player_move.capitalize()} 🆚 Bot: {bot_move.capitalize()}\n\n"
+    if result == 'tie':
+        return text + "🤝 It's a tie!"
+    if result == 'win':
+        return text + f"🏆 {name} wins!"
+    return text + "😞 Bot wins!"
+
+def pick_bot_move(model, smart):
+    """Smart bots counter the predicted move; otherwise (or without data) pick at random."""
+    return (model.counter() if smart else None) or random.choice(['rock', 'paper', 'scissor'])
+
+def bot_move_keyboard(prefix):
+    return [
+        [
+            InlineKeyboardButton("🪨 Rock", callback_data=f"{prefix}rock"),
+            InlineKeyboardButton("📄 Paper", callback_data=f"{prefix}paper"),
+            InlineKeyboardButton("✂️ Scissor", callback_data=f"{prefix}scissor")
+        ]
+    ]
+
+async def start_bot_game(query, context, difficulty="random", rounds=1):
+    """Start a quick game (or a best-of-N match) against the bot."""
     user = query.from_user
     bot_user = await context.bot.get_me()
     
-    # Store game state
+    # Store game state; match rounds are resolved here and written once at the end
     context.user_data['bot_game'] = {
         'player_id': user.id,
         'bot_id': bot_user.id,
-        'round': 1
+        'round': 1,
+        'rounds': rounds,
+        'difficulty': difficulty,
+        'moves': [],
+        'player_score': 0,
+        'bot_score': 0
     }
     
-    # Create a game against the bot
-    keyboard = [
-        [
-            InlineKeyboardButton("🪨 Rock", callback_data=f"bot_move_rock"),
-            InlineKeyboardButton("📄 Paper", callback_data=f"bot_move_paper"),
-            InlineKeyboardButton("✂️ Scissor", callback_data=f"bot_move_scissor")
-        ]
-    ]
+    # Warm the player's move model now so taps never wait on the database
+    await load_move_model(user.id)
+    
+    title = "Smart Bot" if difficulty == "smart" else bot_user.first_name
+    if rounds > 1:
+        # Match buttons carry the owner and round number so other members'
+        # taps and stale taps are rejected
+        keyboard = bot_move_keyboard(f"bot_round_{user.id}_1_")
+        caption = (
+            f"🎮 <b>Best of {rounds} vs {title}</b> 🎮\n\n"
+            f"<b>Round 1/{rounds}</b>\n"
+            f"Make your move, {user.first_name}!"
+        )
+    else:
+        # Smart games carry the difficulty in the move buttons
+        keyboard = bot_move_keyboard("bot_move_smart_" if difficulty == "smart" else "bot_move_")
+        keyboard.append([
+            InlineKeyboardButton(f"🏁 Best of {count}", callback_data=f"quick_game_{difficulty}_{count}")
+            for count in BOT_MATCH_CHOICES
+        ])
+        caption = (
+            f"🎮 <b>Quick Game vs {title}</b> 🎮\n\n"
+            f"Make your move, {user.first_name}!"
+        )
     
     try:
         await query.edit_message_caption(
-            caption=f"🎮 <b>Quick Game vs {bot_user.first_name}</b> 🎮\n\n"
-                   f"Make your move, {user.first_name}!",
+            caption=caption,
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode=ParseMode.HTML
         )
@@ -358,76 +407,57 @@ async def start_bot_game(query, context):
             parse_mode=ParseMode.HTML
         )
 
+async def quick_game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start a best-of-N game from a quick_game_<difficulty>_<rounds> button."""
+    query = update.callback_query
+    await query.answer()
+    
+    user = query.from_user
+    _, _, difficulty, rounds = query.data.split('_')
+    rounds = min(max(int(rounds), 1), BOT_MATCH_MAX_ROUNDS)
+    try:
+        await start_bot_game(query, context, difficulty, rounds)
+    except Exception as e:
+        logger.error(f"Error starting bot match for user {user.id}: {e}")
+        await query.edit_message_caption(
+            caption="⚠️ Error starting quick game. Please try again later.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="back_to_start")]]),
+            parse_mode=ParseMode.HTML
+        )
+
 async def handle_bot_move(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle player's move in a bot game."""
+    started = time.perf_counter()
     query = update.callback_query
     await query.answer()
     
     user = query.from_user
-    player_move = query.data.split('_')[-1]  # Get move from callback data (rock/paper/scissor)
+    parts = query.data.split('_')  # bot_move_<move> or bot_move_smart_<move>
+    player_move = parts[-1]
+    smart = len(parts) == 4 and parts[2] == "smart"
     logger.info(f"Bot game move by user {user.id}: {player_move}")
     
-    # Generate bot's move
-    moves = ['rock', 'paper', 'scissor']
-    bot_move = random.choice(moves)
+    # Only a cold cache (e.g. after a restart) reads the model here
+    model = move_models.get(user.id)
+    if model is None:
+        model = await load_move_model(user.id)
     
-    # Determine winner
-    winner_id = None
-    result_text = f"🎮 <b>Round Result</b> 🎮\n\n"
-    result_text += f"{user.first_name}: {player_move.capitalize()} 🆚 Bot: {bot_move.capitalize()}\n\n"
+    # Generate bot's move and determine winner
+    bot_move = pick_bot_move(model, smart)
+    move_models.observe(user.id, player_move)
+    result = bot_round_result(player_move, bot_move)
+    result_text = f"🎮 <b>Round Result</b> 🎮\n\n" + bot_round_text(user.first_name, player_move, bot_move, result)
     
-    if player_move == bot_move:
-        result = 'tie'
-        result_text += "🤝 It's a tie!"
-        winner_id = None
-    elif (
-        (player_move == 'rock' and bot_move == 'scissor') or
-        (player_move == 'paper' and bot_move == 'rock') or
-        (player_move == 'scissor' and bot_move == 'paper')
-    ):
-        result = 'win'
-        result_text += f"🏆 {user.first_name} wins!"
-        winner_id = user.id
-    else:
-        result = 'loss'
-        result_text += "😞 Bot wins!"
-        winner_id = context.bot.id
-    
-    # Record game in database
+    # Record the game, round, counters and achievements in one transaction
     try:
-        game_id = await record_game(
-            player1_id=user.id,
-            player2_id=context.bot.id,
-            winner_id=winner_id,
-            game_type='bot',
-            rounds=1
-        )
-        
-        # Record round details
-        await record_round(
-            game_id=game_id,
-            round_number=1,
-            player1_move=player_move,
-            player2_move=bot_move,
-            winner_id=winner_id
-        )
-        
-        # Update player bot stats
-        await update_bot_stats(user.id, result, player_move)
-        
-        # Check for achievements
-        stats = await get_user_bot_stats(user.id)
-        if stats['total_games'] == 1:
-            await add_achievement(user.id, "first_bot_game", "Played your first game against the bot!")
-        if result == 'win' and stats['total_wins'] == 1:
-            await add_achievement(user.id, "first_bot_win", "Won your first game against the bot!")
-    
+        with latency.timer('bot_game_db'):
+            await play_bot_round(user.id, context.bot.id, player_move, bot_move, result)
     except Exception as e:
         logger.error(f"Error processing bot game for user {user.id}: {e}")
         result_text += "\n\n⚠️ Error saving game results. Please try again."
     
     keyboard = [
-        [InlineKeyboardButton("🔄 Play Again", callback_data="quick_game")],
+        [InlineKeyboardButton("🔄 Play Again", callback_data="quick_game_smart" if smart else "quick_game")],
         [InlineKeyboardButton("🔙 Main Menu", callback_data="back_to_start")]
     ]
     
@@ -444,3 +474,94 @@ async def handle_bot_move(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="back_to_start")]]),
             parse_mode=ParseMode.HTML
         )
+    latency.record('bot_game', time.perf_counter() - started)
+
+async def handle_bot_round(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle a player's move in a best-of-N match against the bot."""
+    started = time.perf_counter()
+    query = update.callback_query
+    user = query.from_user
+    _, _, owner_id, round_number, player_move = query.data.split('_')  # bot_round_<owner>_<round>_<move>
+    if int(owner_id) != user.id:
+        await query.answer("This match is not yours! Start your own from /start.", show_alert=True)
+        return
+    await query.answer()
+    
+    logger.info(f"Bot match move by user {user.id}: round {round_number}, {player_move}")
+    
+    model = move_models.get(user.id)
+    if model is None:
+        model = await load_move_model(user.id)
+    
+    game = context.user_data.get('bot_game')
+    if not game or game.get('rounds', 1) < 2:
+        # Match state only lives in memory, so it is gone after a restart
+        await query.edit_message_caption(
+            caption="⌛ This match has expired. Start a new one from the menu.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="back_to_start")]]),
+            parse_mode=ParseMode.HTML
+        )
+        return
+    # A double tap or an old message: the round was already played
+    if game['round'] != int(round_number):
+        return
+    
+    # Resolve the round in memory; nothing is written until the match ends
+    bot_move = pick_bot_move(model, game['difficulty'] == "smart")
+    move_models.observe(user.id, player_move)
+    result = bot_round_result(player_move, bot_move)
+    game['moves'].append((player_move, bot_move, result))
+    if result == 'win':
+        game['player_score'] += 1
+    elif result == 'loss':
+        game['bot_score'] += 1
+    
+    rounds = game['rounds']
+    caption = (
+        f"🎮 <b>Round {game['round']}/{rounds} Result</b> 🎮\n\n"
+        + bot_round_text(user.first_name, player_move, bot_move, result)
+        + f"\n\n<b>Score:</b> {user.first_name} {game['player_score']} - {game['bot_score']} Bot"
+    )
+    game['round'] += 1
+    
+    if game['round'] <= rounds:
+        caption += f"\n\n<b>Round {game['round']}/{rounds}</b>: make your move!"
+        keyboard = bot_move_keyboard(f"bot_round_{user.id}_{game['round']}_")
+    else:
+        if game['player_score'] > game['bot_score']:
+            match_result = 'win'
+            caption += f"\n\n🏆 <b>{user.first_name} wins the match!</b>"
+        elif game['player_score'] < game['bot_score']:
+            match_result = 'loss'
+            caption += "\n\n😞 <b>The bot wins the match!</b>"
+        else:
+            match_result = 'tie'
+            caption += "\n\n🤝 <b>The match is a tie!</b>"
+        
+        # One history row and one batched round insert for the whole match
+        try:
+            with latency.timer('bot_game_db'):
+                await play_bot_game(user.id, context.bot.id, game['moves'], match_result)
+        except Exception as e:
+            logger.error(f"Error processing bot match for user {user.id}: {e}")
+            caption += "\n\n⚠️ Error saving game results. Please try again."
+        
+        keyboard = [
+            [InlineKeyboardButton("🔄 Play Again", callback_data=f"quick_game_{game['difficulty']}_{rounds}")],
+            [InlineKeyboardButton("🔙 Main Menu", callback_data="back_to_start")]
+        ]
+    
+    try:
+        await query.edit_message_caption(
+            caption=caption,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.HTML
+        )
+    except Exception as e:
+        logger.error(f"Error updating bot match for user {user.id}: {e}")
+        await query.edit_message_caption(
+            caption="⚠️ Error displaying game result. Please try again.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="back_to_start")]]),
+            parse_mode=ParseMode.HTML
+        )
+    latency.record('bot_game', time.perf_counter() - started)
@@ -5,12 +5,15 @@ import signal
 from telegram import Update
 from pathlib import Path
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes, ChatMemberHandler
-from handlers.start import start, start_callback, handle_bot_move
+from handlers.start import start, start_callback, quick_game_callback, handle_bot_move, handle_bot_round
 from handlers.mod import stats, leaderboard, achievements_callback, back_to_stats_callback, leaderboard_callback, admin_stats
-from handlers.challenge import challenge, challenge_callback, move_callback, clear_challenges_command, handle_rematch
+from handlers.challenge import challenge, challenge_callback, move_callback, clear_challenges_command, handle_rematch, fast_move_callback, challenge_timer_job, TIMER_TICK
 from handlers.data import manage_data_command, manage_data_callback
 from handlers.group_handler import chat_member_update
-from database.connection import ensure_tables_exist
+from handlers.media import media_cache, refresh_media_command, MEDIA_WARMUP_CHAT_ID
+from handlers.outbound import outbound
+from database.connection import ensure_tables_exist, close_db_pool, close_bot_game_log, flush_pending_writes, load_rank_index, ACTIVITY_FLUSH_INTERVAL
+from database.backup import backup_database, BACKUP_INTERVAL
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -27,10 +30,27 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN not found in environment variables.")
 
+# Number of updates processed at the same time (1 = one at a time)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
 # Error handler
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.error(f"Update {update} caused error: {context.error}")
 
+# Periodic flush of write-behind buffers
+async def flush_buffers_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        await flush_pending_writes()
+    except Exception as e:
+        logger.error(f"Error flushing buffered writes: {e}")
+
+# Periodic online backup of the database
+async def backup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        await backup_database()
+    except Exception as e:
+        logger.error(f"Error backing up database: {e}")
+
 async def main():
     """Main function to run the bot."""
     logger.info("Initializing bot...")
@@ -39,11 +59,20 @@ async def main():
         # Initialize database with proper path handling
         await ensure_tables_exist()
         logger.info("Database initialized successfully")
+        ranked = await load_rank_index()
+        logger.info(f"Rank index built for {ranked} players")
+        cached = await media_cache.load()
+        logger.info(f"Loaded {cached} cached media file_ids")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
     
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(max(MAX_CONCURRENT_UPDATES, 1))
+        .build()
+    )
 
     # Register command handlers
     app.add_handler(CommandHandler("start", start))
@@ -54,20 +83,30 @@ async def main():
     app.add_handler(CommandHandler("challenge", challenge))
     app.add_handler(CallbackQueryHandler(challenge_callback, pattern=r"^(accept|decline)_"))
     app.add_handler(CallbackQueryHandler(move_callback, pattern=r"^move_(rock|paper|scissor)_"))
+    app.add_handler(CallbackQueryHandler(fast_move_callback, pattern=r"^fmove_(rock|paper|scissor)$"))
     app.add_handler(CallbackQueryHandler(achievements_callback, pattern=r"^achievements_\d+$"))
     app.add_handler(CallbackQueryHandler(back_to_stats_callback, pattern=r"^back_to_stats_\d+$"))
-    app.add_handler(CallbackQueryHandler(start_callback, pattern=r"^(help|stats|quick_game|leaderboard|achievements|back_to_start)$"))
+    app.add_handler(CallbackQueryHandler(start_callback, pattern=r"^(help|stats|quick_game|quick_game_smart|leaderboard|achievements|back_to_start)$"))
     app.add_handler(CallbackQueryHandler(leaderboard_callback, pattern=r"^leaderboard_.*$"))
     app.add_handler(CallbackQueryHandler(leaderboard_callback, pattern="^leaderboardgroup_"))
     app.add_handler(CallbackQueryHandler(leaderboard_callback, pattern="^back$"))
     app.add_handler(CallbackQueryHandler(start_callback, pattern="^back_to_start$"))
+    app.add_handler(CallbackQueryHandler(quick_game_callback, pattern=r"^quick_game_(random|smart)_\d+$"))
     app.add_handler(CallbackQueryHandler(handle_bot_move, pattern="^bot_move_"))
+    app.add_handler(CallbackQueryHandler(handle_bot_round, pattern=r"^bot_round_\d+_\d+_(rock|paper|scissor)$"))
     app.add_handler(CallbackQueryHandler(handle_rematch, pattern="^rematch_"))
     app.add_handler(CommandHandler("mdata", manage_data_command))
+    app.add_handler(CommandHandler("refreshmedia", refresh_media_command))
     app.add_handler(CallbackQueryHandler(manage_data_callback, pattern="^(confirm_wipe_all|cancel_wipe_all|confirm_delete_user|cancel_delete_user|confirm_delete_group|cancel_delete_group)_"))
     app.add_handler(ChatMemberHandler(chat_member_update, ChatMemberHandler.MY_CHAT_MEMBER))
     app.add_error_handler(error_handler)
 
+    # Scheduled jobs
+    app.job_queue.run_repeating(challenge_timer_job, interval=TIMER_TICK, first=TIMER_TICK)
+    app.job_queue.run_repeating(flush_buffers_job, interval=ACTIVITY_FLUSH_INTERVAL, first=ACTIVITY_FLUSH_INTERVAL)
+    if BACKUP_INTERVAL > 0:
+        app.job_queue.run_repeating(backup_job, interval=BACKUP_INTERVAL, first=BACKUP_INTERVAL)
+
     # Enhanced shutdown handling
     async def enhanced_shutdown():
         """Enhanced shutdown procedure with database safety checks."""
@@ -76,8 +115,15 @@ async def main():
             if app.updater:
                 await app.updater.stop()
             await app.stop()
+            # Send queued game messages while the bot can still reach Telegram
+            await outbound.drain()
             await app.shutdown()
             
+            # Write out buffered activity, then close pooled database connections
+            await flush_pending_writes()
+            await close_db_pool()
+            close_bot_game_log()
+            
             # Verify database file exists
             if not Path("data/trihand.db").exists():
                 logger.warning("Database file not found after shutdown!")
@@ -112,6 +158,14 @@ async def main():
         await app.initialize()
         await app.start()
         
+        # Upload uncached images once so the first /start doesn't wait on the image host
+        if MEDIA_WARMUP_CHAT_ID:
+            try:
+                warmed = await media_cache.warm_up(app.bot, int(MEDIA_WARMUP_CHAT_ID))
+                logger.info(f"Media warm-up uploaded {warmed} images")
+            except Exception as e:
+                logger.error(f"Media warm-up failed: {e}")
+        
         # Start updater with proper error handling
         if app.updater:
             await app.updater.start_polling(
@@ -0,0 +1,36 @@
+import sqlite3
+import time
+
+import database.backup as backup
+
+def _make_db(path, rows=400):
+    conn = sqlite3.connect(str(path))
+    conn.execute('CREATE TABLE filler (id INTEGER PRIMARY KEY, body TEXT)')
+    conn.executemany('INSERT INTO filler (body) VALUES (?)', [('x' * 500,) for _ in range(rows)])
+    conn.commit()
+    conn.close()
+
+def test_online_backup_sleeps_between_steps(tmp_path, monkeypatch):
+    source = tmp_path / "trihand.db"
+    _make_db(source)
+    monkeypatch.setattr(backup, "DB_PATH", source)
+
+    started = time.monotonic()
+    progress = backup._online_backup(tmp_path / "copy.db", pages=5, sleep=0.01)
+    elapsed = time.monotonic() - started
+
+    assert progress['steps'] > 5
+    # One sleep after every step but the last
+    assert elapsed >= (progress['steps'] - 1) * 0.01
+    copy = sqlite3.connect(str(tmp_path / "copy.db"))
+    assert copy.execute('SELECT COUNT(*) FROM filler').fetchone()[0] == 400
+    copy.close()
+
+def test_online_backup_without_sleep(tmp_path, monkeypatch):
+    source = tmp_path / "trihand.db"
+    _make_db(source, rows=10)
+    monkeypatch.setattr(backup, "DB_PATH", source)
+
+    progress = backup._online_backup(tmp_path / "copy.db", pages=-1, sleep=0)
+
+    assert progress['steps'] == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import database.connection as connection
+
+@pytest.fixture
+def fresh_pool(tmp_path, monkeypatch):
+    """Point the module-level pool at an empty database in ``tmp_path``."""
+    monkeypatch.setattr(connection, "DB_DIR", tmp_path)
+    monkeypatch.setattr(connection, "DB_PATH", tmp_path / "trihand.db")
+    monkeypatch.setattr(connection, "_pool", None)
+    monkeypatch.setattr(connection, "_pool_closed", False)
+    monkeypatch.setattr(connection, "_pool_lock", asyncio.Lock())
+
+def test_close_waits_for_borrowed_readers(fresh_pool):
+    async def run():
+        pool = await connection.init_db_pool()
+        events = []
+
+        async def slow_read():
+            async with connection.get_db_connection(readonly=True) as conn:
+                await asyncio.sleep(0.05)
+                async with conn.execute('SELECT 1') as cursor:
+                    events.append(('read', (await cursor.fetchone())[0]))
+
+        reading = asyncio.create_task(slow_read())
+        await asyncio.sleep(0)
+        await connection.close_db_pool()
+        events.append(('closed', pool.closed))
+        await reading
+        return events
+
+    assert asyncio.run(run()) == [('read', 1), ('closed', True)]
+
+def test_closed_pool_is_not_reopened(fresh_pool):
+    async def run():
+        await connection.init_db_pool()
+        await connection.close_db_pool()
+        await connection.close_db_pool()
+        await connection.flush_pending_writes()
+        with pytest.raises(RuntimeError):
+            async with connection.get_db_connection(readonly=True):
+                pass
+        assert connection._pool is None
+
+    asyncio.run(run())
+
+def test_known_users_are_capped(fresh_pool, monkeypatch):
+    monkeypatch.setattr(connection, "KNOWN_USERS_SIZE", 2)
+    monkeypatch.setattr(connection, "_known_users", connection.OrderedDict())
+    monkeypatch.setattr(connection, "_pending_users", {})
+    monkeypatch.setattr(connection, "_schema_version", None)
+
+    async def run():
+        await connection.ensure_tables_exist()
+        for user_id in (1, 2, 1, 3):
+            await connection.update_user_activity(user_id, f"U{user_id}")
+        known = list(connection._known_users)
+        # A forgotten user still gets the full upsert
+        await connection.update_user_activity(2, "U2")
+        await connection.close_db_pool()
+        return known
+
+    assert asyncio.run(run()) == [1, 3]
+    assert 2 in connection._known_users
@@ -0,0 +1,45 @@
+import asyncio
+
+import aiosqlite
+
+from database.migrations import LATEST_VERSION, _create_base_schema, run_migrations
+
+def _migrate_from_v1(path, seed):
+    """Create a version 1 database, fill it with ``seed`` and migrate it."""
+    async def run():
+        async with aiosqlite.connect(str(path), isolation_level=None) as conn:
+            conn.row_factory = aiosqlite.Row
+            await _create_base_schema(conn)
+            await conn.execute('PRAGMA user_version = 1')
+            await seed(conn)
+            assert await run_migrations(conn) == LATEST_VERSION
+            async with conn.execute(
+                'SELECT user_id, wins, losses, ties, games, last_played FROM group_stats ORDER BY user_id'
+            ) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+    return asyncio.run(run())
+
+async def _add_game(conn, game_id, winner_id, rounds, played, date_played):
+    await conn.execute('''
+        INSERT INTO game_history (game_id, player1_id, player2_id, winner_id, game_type, rounds, date_played, group_id)
+        VALUES (?, 1, 2, ?, 'challenge', ?, ?, -5)
+    ''', (game_id, winner_id, rounds, date_played))
+    for number in range(1, played + 1):
+        await conn.execute('''
+            INSERT INTO round_details (game_id, round_number, player1_move, player2_move, winner_id)
+            VALUES (?, ?, 'rock', 'rock', NULL)
+        ''', (game_id, number))
+
+def test_group_stats_backfill_skips_abandoned_games(tmp_path):
+    async def seed(conn):
+        await conn.execute("INSERT INTO users (user_id, first_name) VALUES (1, 'A'), (2, 'B')")
+        await conn.execute("INSERT INTO groups (group_id, title) VALUES (-5, 'G')")
+        await _add_game(conn, 1, 1, 1, 1, '2024-01-01 10:00:00')  # won
+        await _add_game(conn, 2, None, 3, 1, '2024-01-03 10:00:00')  # abandoned after one round
+        await _add_game(conn, 3, None, 2, 2, '2024-01-02 10:00:00')  # tied, all rounds played
+
+    rows = _migrate_from_v1(tmp_path / "trihand.db", seed)
+    assert rows == [
+        {'user_id': 1, 'wins': 1, 'losses': 0, 'ties': 1, 'games': 2, 'last_played': '2024-01-02 10:00:00'},
+        {'user_id': 2, 'wins': 0, 'losses': 1, 'ties': 1, 'games': 2, 'last_played': '2024-01-02 10:00:00'},
+    ]
@@ -0,0 +1,42 @@
+import random
+import timeit
+
+from database.move_model import MODEL_SIZE, MOVES, MoveModel, MoveModelCache
+
+def test_counters_a_repeating_pattern():
+    model = MoveModel()
+    for move in ['rock', 'paper', 'scissor'] * 5:
+        model.update(move)
+    # After ... paper, scissor the player goes back to rock
+    assert model.predict() == 'rock'
+    assert model.counter() == 'paper'
+
+def test_no_prediction_without_data():
+    assert MoveModel().predict() is None
+
+def test_blob_round_trip():
+    model = MoveModel()
+    for move in random.choices(MOVES, k=50):
+        model.update(move)
+    blob = model.to_blob()
+    assert len(blob) == MODEL_SIZE * 2
+    assert MoveModel.from_blob(blob).counts == model.counts
+    assert MoveModel.from_blob(b'\x00\x01').counts == MoveModel().counts
+
+def test_evicted_dirty_model_is_still_written():
+    cache = MoveModelCache(size=1)
+    cache.put(1, MoveModel())
+    cache.observe(1, 'rock')
+    cache.put(2, MoveModel())
+    assert [user_id for user_id, _ in cache.take_dirty()] == [1]
+    assert cache.take_dirty() == []
+
+def test_predict_and_update_cost():
+    """The smart bot's per-tap work stays in the microsecond range."""
+    model = MoveModel()
+    for move in random.choices(MOVES, k=500):
+        model.update(move)
+    rounds = 20_000
+    seconds = timeit.timeit(lambda: (model.counter(), model.update(random.choice(MOVES))), number=rounds)
+    # About 5 us per move on a laptop; the bound leaves room for slow CI machines
+    assert seconds / rounds < 100e-6
@@ -0,0 +1,117 @@
+import asyncio
+
+from telegram.error import RetryAfter
+
+import handlers.outbound as outbound_module
+from handlers.outbound import OutboundQueue, TokenBucket
+
+class FakeBot:
+    """Records Bot API calls in the order they reach "Telegram"."""
+
+    def __init__(self, flood_once=False):
+        self.calls = []
+        self.flood_once = flood_once
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.flood_once:
+            self.flood_once = False
+            raise RetryAfter(0.05)
+        self.calls.append(('send', text))
+        return len(self.calls)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.calls.append(('edit', text))
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(('delete', message_id))
+
+def _throttled_queue(monkeypatch, rate=50.0, burst=1):
+    """A queue whose per-chat bucket only lets one call through at a time."""
+    monkeypatch.setattr(outbound_module, "OUTBOUND_CHAT_RATE", rate)
+    monkeypatch.setattr(outbound_module, "OUTBOUND_CHAT_BURST", burst)
+    return OutboundQueue()
+
+def test_send_waits_for_edits_queued_before_it(monkeypatch):
+    queue = _throttled_queue(monkeypatch)
+    bot = FakeBot()
+
+    async def run():
+        await queue.edit_message_text(bot, 1, 10, "Round 3 Result", coalesce=False)
+        await queue.edit_message_text(bot, 1, 10, "Game Over!", coalesce=False)
+        await queue.send_message(bot, 1, "Want to play again?")
+        await queue.drain()
+
+    asyncio.run(run())
+    assert bot.calls == [('edit', "Round 3 Result"), ('edit', "Game Over!"), ('send', "Want to play again?")]
+
+def test_only_back_to_back_edits_are_coalesced(monkeypatch):
+    queue = _throttled_queue(monkeypatch)
+    bot = FakeBot()
+
+    async def run():
+        await queue.edit_message_text(bot, 1, 10, "In Progress 0")
+        await queue.edit_message_text(bot, 1, 10, "Round 1 Result", coalesce=False)
+        await queue.edit_message_text(bot, 1, 10, "Game Continues")
+        await queue.edit_message_text(bot, 1, 10, "In Progress 1")
+        await queue.edit_message_text(bot, 1, 10, "In Progress 2")
+        sending = asyncio.create_task(queue.send_message(bot, 1, "your move"))
+        await asyncio.sleep(0)
+        await queue.edit_message_text(bot, 1, 10, "In Progress 3")
+        await sending
+        await queue.drain()
+
+    asyncio.run(run())
+    assert bot.calls == [
+        ('edit', "Round 1 Result"),
+        ('edit', "In Progress 2"),
+        ('send', "your move"),
+        ('edit', "In Progress 3"),
+    ]
+    assert queue.coalesced == 3
+
+def test_unchanged_edit_is_skipped(monkeypatch):
+    queue = _throttled_queue(monkeypatch)
+    bot = FakeBot()
+
+    async def run():
+        await queue.edit_message_text(bot, 1, 10, "same")
+        await queue.drain()
+        await queue.edit_message_text(bot, 1, 10, "same")
+        await queue.drain()
+
+    asyncio.run(run())
+    assert bot.calls == [('edit', "same")]
+    assert queue.skipped == 1
+
+def test_retry_after_pauses_the_global_bucket(monkeypatch):
+    queue = _throttled_queue(monkeypatch, rate=1000.0, burst=100)
+    bot = FakeBot(flood_once=True)
+
+    async def run():
+        await queue.send_message(bot, 1, "hello")
+
+    asyncio.run(run())
+    assert bot.calls == [('send', "hello")]
+    assert queue.retries == 1
+    # Without the pause the global bucket would still hold most of its burst
+    assert queue._global.tokens < 0
+
+def test_drain_sends_everything_queued(monkeypatch):
+    queue = _throttled_queue(monkeypatch, rate=100.0)
+    bot = FakeBot()
+
+    async def run():
+        for chat_id in (1, 2):
+            await queue.edit_message_text(bot, chat_id, 10, "a", coalesce=False)
+            await queue.edit_message_text(bot, chat_id, 10, "b", coalesce=False)
+        await queue.drain()
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert sorted(bot.calls) == [('edit', "a"), ('edit', "a"), ('edit', "b"), ('edit', "b")]
+    assert stats['queued'] == 0
+
+def test_token_bucket_pause_delays_the_next_reserve():
+    bucket = TokenBucket(rate=10, capacity=1)
+    bucket.pause(0.5)
+    assert bucket.reserve() > 0.5
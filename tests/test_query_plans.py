@@ -0,0 +1,108 @@
+import ast
+import asyncio
+import re
+import sqlite3
+from pathlib import Path
+
+import aiosqlite
+import pytest
+
+from database.migrations import LATEST_VERSION, run_migrations
+
+ROOT = Path(__file__).resolve().parent.parent
+SOURCES = sorted((ROOT / "database").glob("*.py")) + sorted((ROOT / "handlers").glob("*.py"))
+SQL_START = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\s", re.IGNORECASE)
+
+# Statements that are meant to read or clear a whole table (admin listings,
+# global counts, the broadcast list, the media cache load and the full wipe)
+WHOLE_TABLE_STATEMENTS = {
+    "SELECT COUNT(*) as count FROM users",
+    "SELECT COUNT(*) as count FROM groups",
+    "SELECT COALESCE(SUM(total_games), 0) as count FROM bot_stats",
+    "SELECT user_id FROM users",
+    "SELECT media_key, url, file_id FROM media_cache",
+    "SELECT user_id, first_name, last_name, username FROM users",
+    "SELECT group_id, title, username FROM groups",
+    "SELECT user_id, first_name, last_name, username, joined_date, last_active FROM users ORDER BY user_id",
+    "SELECT group_id, title, username, joined_date, last_active, member_count FROM groups ORDER BY group_id",
+    "DELETE FROM {table}",
+}
+
+def _normalise(sql):
+    return " ".join(sql.split())
+
+def _collect_statements():
+    """``(location, display_sql, explain_sql)`` for every SQL literal in the sources.
+
+    f-string fields are shown as ``{expr}`` and planned as ``1``.
+    """
+    statements = []
+    for path in SOURCES:
+        if path.name == "migrations.py":
+            continue
+        tree = ast.parse(path.read_text())
+        # f-string pieces and docstrings are not statements of their own
+        skipped = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.JoinedStr):
+                skipped.update(id(value) for value in node.values)
+            elif isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                if node.body and isinstance(node.body[0], ast.Expr):
+                    skipped.add(id(node.body[0].value))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.JoinedStr):
+                display = "".join(
+                    value.value if isinstance(value, ast.Constant) else "{" + ast.unparse(value.value) + "}"
+                    for value in node.values
+                )
+                explain = "".join(
+                    value.value if isinstance(value, ast.Constant) else "1" for value in node.values
+                )
+            elif isinstance(node, ast.Constant) and isinstance(node.value, str) and id(node) not in skipped:
+                display = explain = node.value
+            else:
+                continue
+            if SQL_START.match(explain):
+                statements.append((f"{path.name}:{node.lineno}", _normalise(display), explain))
+    return statements
+
+@pytest.fixture(scope="module")
+def migrated_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp("plans") / "trihand.db"
+
+    async def migrate():
+        async with aiosqlite.connect(str(path), isolation_level=None) as conn:
+            assert await run_migrations(conn) == LATEST_VERSION
+
+    asyncio.run(migrate())
+    conn = sqlite3.connect(str(path))
+    yield conn
+    conn.close()
+
+def _full_scans(sql, plan):
+    """Plan steps that read a whole table (or sort a whole-table result)."""
+    details = [row[3] for row in plan]
+    sorted_in_memory = any("TEMP B-TREE" in detail for detail in details)
+    has_limit = re.search(r"\bLIMIT\b", sql, re.IGNORECASE) is not None
+    scans = []
+    for detail in details:
+        if not detail.startswith("SCAN ") or detail == "SCAN CONSTANT ROW":
+            continue
+        # Walking an index in order for a top-N query stops after LIMIT rows
+        if " INDEX " in detail and has_limit and not sorted_in_memory:
+            continue
+        scans.append(detail)
+    return scans
+
+STATEMENTS = _collect_statements()
+
+def test_statements_found():
+    assert len(STATEMENTS) > 30
+
+@pytest.mark.parametrize("location,display,sql", STATEMENTS, ids=[s[0] for s in STATEMENTS])
+def test_no_full_table_scans(migrated_db, location, display, sql):
+    if display in WHOLE_TABLE_STATEMENTS:
+        pytest.skip("reads the whole table on purpose")
+    sql = re.sub(r"\?\d+", "?", sql)
+    plan = migrated_db.execute("EXPLAIN QUERY PLAN " + sql, [None] * sql.count("?")).fetchall()
+    assert not _full_scans(sql, plan), f"{location}: {display}"